@@ -1,20 +1,40 @@
 import json
 import os
+import unicodedata
 import asyncio
+import heapq
 import threading
 import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, zip_longest
+from operator import attrgetter
 from loguru import logger
 from datetime import datetime
+from dotenv import load_dotenv
+
+# uvloop (2-4x быстрее на сокетном I/O) подключаем опционально,
+# как и orjson - stdlib-реализация остается рабочим fallback
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 from .services.telegram_bot import TelegramBotService
 from .services.discord_websocket import EnhancedDiscordWebSocketService
-from .config.settings import config
+from .config.settings import config, CHANNEL_MAPPINGS_FILE
 from .main import DiscordParser
+from .utils.channel_id_parser import parse_discord_servers
+from .utils.json_io import dumps_indented
+from .utils.rate_limiter import AsyncTokenBucket
+
+# Одинокие суррогаты вырезаем C-реализованным str.translate вместо
+# пер-символьного generator expression (прочих кодов >= 0x110000 в str не бывает)
+_SURROGATE_TABLE = dict.fromkeys(range(0xD800, 0xE000))
 
 class EnhancedDiscordTelegramParser:
     def __init__(self):
         # Перезагружаем переменные окружения
-        from dotenv import load_dotenv
         load_dotenv(override=True)
         
         self.discord_parser = DiscordParser()
@@ -29,12 +49,84 @@ class EnhancedDiscordTelegramParser:
         
         self.running = False
         self.websocket_task = None
+
+        # Общий лимитер Discord REST запросов (50 req / 10 сек глобально)
+        self.rate_limiter = AsyncTokenBucket(rate=5.0, capacity=50)
+
+        # Лимитер отправки в Telegram (глобальный кап ~30 msg/сек, держим запас)
+        self._tg_bucket = AsyncTokenBucket(rate=25.0, capacity=25)
+
+        # Очередь исходящих сообщений в Telegram (коалесцирующая отправка).
+        # Ограничена: при залипании Telegram продюсеры притормаживают на
+        # put() вместо неограниченного накопления сообщений в памяти
+        self._outbound = asyncio.Queue(maxsize=10_000)
+        self.websocket_service.outbound_queue = self._outbound
+
+        # Кэш санитизированных имен серверов/каналов (имена из конфига неизменны)
+        self._safe_name_cache = {}
+
+        # Плоский список (server, channel_id, safe_server, safe_channel)
+        # вместо повторного обхода вложенного dict на каждом цикле
+        self._channel_list = []
+        self._rebuild_channel_list()
+        self.websocket_service.on_mappings_changed = self._rebuild_channel_list
+
+        # По одному запросу на сервер одновременно: вместе с round-robin
+        # порядком каналов держит нагрузку под лимитом 5/5 сек на сервер
+        self._server_sems = defaultdict(lambda: asyncio.Semaphore(1))
+
+        # Сигнатура последней синхронизации серверов (пропуск холостых проходов)
+        self._last_sync_sig = None
+
+        # Курсор резервного поллинга: окно из 20 каналов продолжает обход
+        # с места остановки прошлого цикла, а не всегда с начала списка
+        self._poll_cursor = 0
+
+        # Память HTTP-доступности каналов: вердикт пробы с начальной
+        # синхронизации, резервный поллинг не перепроверяет его каждый цикл
+        self._http_accessible = set()
+        self._http_recheck_interval = 3600  # Раз в час даем каналам шанс "ожить"
+        self._next_http_recheck = time.monotonic() + self._http_recheck_interval
+
+        # Последний виденный message_id по каналам: передаем в Discord как
+        # after=..., для тихих каналов приходит пустой ответ вместо N сообщений
+        self._last_seen = {}
+
+        # LRU недавно пересланных message_id: WebSocket и резервный поллинг
+        # видят одни и те же сообщения - дубликаты в Telegram не шлем
+        self._sent_ids = OrderedDict()
+        self._sent_ids_max = 10_000
+
+        # Событие остановки: главная корутина ждет его вместо опроса флага
+        self._stop_event = asyncio.Event()
+
+    def _rebuild_channel_list(self):
+        """Перестроить плоский список каналов после изменения маппингов
+
+        Каналы чередуются round-robin по серверам: Discord лимитирует
+        5 запросов / 5 сек на сервер, подряд идущие каналы одного сервера
+        упирались бы в этот лимит, пока остальные серверы простаивают.
+        Санитизированные имена вычисляются здесь же - циклы поллинга
+        получают готовые строки без всяких вызовов на итерацию.
+        """
+        per_server = defaultdict(list)
+        for server, channels in config.SERVER_CHANNEL_MAPPINGS.items():
+            safe_server = self.safe_encode_name(server)
+            for channel_id, channel_name in channels.items():
+                per_server[server].append(
+                    (server, channel_id, safe_server, self.safe_encode_name(channel_name))
+                )
+
+        self._channel_list = [
+            entry
+            for group in zip_longest(*per_server.values())
+            for entry in group
+            if entry is not None
+        ]
         
     def discover_all_servers(self):
         """Полное обнаружение всех серверов с улучшенным алгоритмом"""
         try:
-            from discord_telegram_parser.utils.channel_id_parser import parse_discord_servers
-            
             logger.info("🔍 Запускаем полное обнаружение серверов...")
             mappings = parse_discord_servers()
             
@@ -49,14 +141,31 @@ class EnhancedDiscordTelegramParser:
                 logger.info(f"   📊 Стало серверов: {new_count}")
                 logger.info(f"   📊 Прирост: +{new_count - old_count}")
                 
-                # Добавляем обнаруженные каналы в WebSocket подписки
-                for server, channels in mappings.items():
-                    for channel_id in channels.keys():
-                        self.websocket_service.add_channel_subscription(channel_id)
-                
+                # Обновляем WebSocket подписки только на разницу: повторное
+                # добавление всех известных каналов каждый прогон - шум в
+                # логах и холостая работа
+                discovered_ids = {
+                    channel_id
+                    for channels in mappings.values()
+                    for channel_id in channels
+                }
+                for channel_id in discovered_ids - self.websocket_service.subscribed_channels:
+                    self.websocket_service.add_channel_subscription(channel_id)
+                for channel_id in self.websocket_service.subscribed_channels - discovered_ids:
+                    self.websocket_service.remove_channel_subscription(channel_id)
+
+                # Индекс channel_id -> (server, name) сервиса строится из
+                # SERVER_CHANNEL_MAPPINGS - после ребинда маппингов без
+                # пересборки MESSAGE_CREATE по новым каналам падал бы в
+                # "немапленный канал" и отбрасывался
+                self.websocket_service._rebuild_channel_index()
+
+                # Обновляем плоский список каналов
+                self._rebuild_channel_list()
+
                 # Сохраняем конфиг
                 self._save_config_to_file(mappings)
-                
+
                 return mappings
             else:
                 logger.error("❌ Обнаружение серверов не дало результатов")
@@ -67,86 +176,87 @@ class EnhancedDiscordTelegramParser:
             return {}
 
     def _save_config_to_file(self, mappings):
-        """Сохраняем обновленную конфигурацию в файл"""
+        """Сохраняем обновленные маппинги в JSON sidecar (атомарно)"""
         try:
-            config_file = 'discord_telegram_parser/config/settings.py'
-            
-            # Читаем существующий файл
-            with open(config_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Подготавливаем новую секцию конфигурации
-            new_config_section = f"\n# Auto-discovered servers - Updated {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\nconfig.SERVER_CHANNEL_MAPPINGS = {json.dumps(mappings, indent=2, ensure_ascii=False)}\n"
-            
-            # Добавляем в конец файла
-            content += new_config_section
-            
-            # Записываем обратно
-            with open(config_file, 'w', encoding='utf-8') as f:
-                f.write(content)
-                
+            # Пишем во временный файл и атомарно подменяем
+            tmp_file = CHANNEL_MAPPINGS_FILE + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write(dumps_indented(mappings))
+            os.replace(tmp_file, CHANNEL_MAPPINGS_FILE)
+
             logger.info(f"💾 Конфигурация сохранена: {len(mappings)} серверов")
-            
+
         except Exception as e:
             logger.error(f"❌ Ошибка сохранения конфигурации: {e}")
 
     async def websocket_main_loop(self):
-        """Главный async цикл для WebSocket сервиса с автообнаружением"""
-        while self.running:
-            try:
-                logger.info("🚀 Starting WebSocket connections with auto-discovery...")
-                await self.websocket_service.start()
-            except Exception as e:
-                error_msg = str(e).encode('utf-8', 'replace').decode('utf-8')
-                logger.error(f"WebSocket error: {error_msg}")
-                logger.info("Restarting WebSocket in 30 seconds...")
-                await asyncio.sleep(30)
-    
-    def run_websocket_in_thread(self):
-        """Запуск WebSocket сервиса в отдельном потоке с async loop"""
-        def websocket_thread():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(self.websocket_main_loop())
-            except Exception as e:
-                logger.error(f"WebSocket thread error: {e}")
-            finally:
-                loop.close()
-        
-        thread = threading.Thread(target=websocket_thread, daemon=True)
-        thread.start()
-        return thread
-    
+        """Главный async цикл для WebSocket сервиса с автообнаружением
+
+        Переподключением отдельных Gateway-сессий (с экспоненциальным
+        backoff и jitter) управляет сам сервис - здесь только запуск и
+        диагностика фатальных ошибок.
+        """
+        logger.info("🚀 Starting WebSocket connections with auto-discovery...")
+        try:
+            await self.websocket_service.start()
+        except Exception as e:
+            error_msg = str(e).encode('utf-8', 'replace').decode('utf-8')
+            logger.error(f"WebSocket error: {error_msg}")
+
     def safe_encode_string(self, text):
         """Безопасное кодирование строк для обработки Unicode"""
         if not text:
             return ""
         try:
             if isinstance(text, str):
+                # ASCII не содержит ни суррогатов, ни проблемных кодов -
+                # O(1)-проверка отсекает большинство сообщений сразу
+                if text.isascii():
+                    return text
                 text = text.encode('utf-8', 'surrogatepass').decode('utf-8', 'replace')
-                text = ''.join(char for char in text if ord(char) < 0x110000)
+                text = text.translate(_SURROGATE_TABLE)
+                # Quick-Check в C почти мгновенно подтверждает, что строка
+                # уже в NFC (подавляющее большинство) - нормализуем остальное
+                if not unicodedata.is_normalized('NFC', text):
+                    text = unicodedata.normalize('NFC', text)
             return text
         except (UnicodeEncodeError, UnicodeDecodeError):
             return "[Encoding Error]"
     
-    def test_channel_http_access(self, channel_id):
-        """Быстрый тест доступности канала через HTTP"""
-        try:
-            session = self.discord_parser.sessions[0]
-            r = session.get(f'https://discord.com/api/v9/channels/{channel_id}/messages?limit=1')
-            return r.status_code == 200
-        except:
-            return False
-    
+    def safe_encode_name(self, text):
+        """Кэшированный safe_encode_string для коротких повторяющихся строк
+
+        Имена серверов/каналов из конфига и ники авторов повторяются из
+        цикла в цикл - пересанитизировать их на каждом проходе незачем.
+        """
+        cached = self._safe_name_cache.get(text)
+        if cached is None:
+            # Грубая защита от неограниченного роста на потоке авторов
+            if len(self._safe_name_cache) > 4096:
+                self._safe_name_cache.clear()
+            cached = self.safe_encode_string(text)
+            self._safe_name_cache[text] = cached
+        return cached
+
     def sync_servers_enhanced(self):
         """Улучшенная синхронизация серверов между Discord и Telegram"""
         try:
-            # Получаем текущие серверы Discord
-            current_servers = set(config.SERVER_CHANNEL_MAPPINGS.keys())
-            
-            # Получаем топики Telegram
-            telegram_topics = set(self.telegram_bot.server_topics.keys())
+            # Маппинги могли измениться (автообнаружение) - обновляем список
+            self._rebuild_channel_list()
+
+            # Если ни серверы, ни топики не изменились - синхронизировать нечего
+            sig = (
+                frozenset(config.SERVER_CHANNEL_MAPPINGS),
+                frozenset(self.telegram_bot.server_topics)
+            )
+            if sig == self._last_sync_sig:
+                logger.debug("🔄 Server sync skipped - nothing changed")
+                return
+
+            # Живые keys views вместо копирования ключей в set - разность
+            # множеств работает с ними напрямую
+            current_servers = config.SERVER_CHANNEL_MAPPINGS.keys()
+            telegram_topics = self.telegram_bot.server_topics.keys()
             
             logger.info(f"🔄 Enhanced server sync...")
             logger.info(f"   📊 Discord servers: {len(current_servers)}")
@@ -157,8 +267,7 @@ class EnhancedDiscordTelegramParser:
             cleaned_topics = self.telegram_bot.cleanup_invalid_topics()
             if cleaned_topics > 0:
                 logger.info(f"   🧹 Cleaned {cleaned_topics} invalid topics")
-                telegram_topics = set(self.telegram_bot.server_topics.keys())
-            
+
             # Находим новые серверы (топики будут созданы при необходимости)
             new_servers = current_servers - telegram_topics
             if new_servers:
@@ -170,27 +279,128 @@ class EnhancedDiscordTelegramParser:
             removed_servers = telegram_topics - current_servers
             if removed_servers:
                 logger.info(f"   🗑️ Removing topics for deleted servers: {len(removed_servers)}")
+                removed_any = False
                 for server in removed_servers:
                     if server in self.telegram_bot.server_topics:
                         old_topic_id = self.telegram_bot.server_topics[server]
                         del self.telegram_bot.server_topics[server]
+                        removed_any = True
                         logger.info(f"      • Removed {server} (topic {old_topic_id})")
-                
-                if removed_servers:
+
+                # Одна запись на диск после всех удалений, не по записи на сервер
+                if removed_any:
                     self.telegram_bot._save_data()
-            
+
+            # Запоминаем состояние после синхронизации (топики могли измениться)
+            self._last_sync_sig = (
+                frozenset(config.SERVER_CHANNEL_MAPPINGS),
+                frozenset(self.telegram_bot.server_topics)
+            )
+
             logger.success(f"✅ Enhanced server sync completed")
             
         except Exception as e:
             error_msg = str(e).encode('utf-8', 'replace').decode('utf-8')
             logger.error(f"❌ Error in enhanced server sync: {error_msg}")
 
-    def initial_sync_enhanced(self):
+    async def _fetch_channel_messages(self, sem, channel_id, safe_server, safe_channel, limit, use_after=False):
+        """Выборка одного канала под семафором
+
+        Отдельной GET-пробы больше нет: доступность классифицируем по
+        статусу самой выборки (один RTT вместо двух на каждый канал).
+        Возвращает None если канал недоступен по HTTP (WebSocket-only).
+        С use_after=True запрашивает только сообщения новее последнего
+        виденного - тихие каналы возвращают пустой ответ без парсинга.
+        """
+        async with sem, self._server_sems[safe_server]:
+            async with self.rate_limiter:
+                messages, status = await asyncio.to_thread(
+                    self.discord_parser.parse_announcement_channel,
+                    channel_id,
+                    safe_server,
+                    safe_channel,
+                    limit,
+                    self._last_seen.get(channel_id) if use_after else None,
+                    True  # with_status
+                )
+
+            if status is None or status in (401, 403, 404):
+                self._http_accessible.discard(channel_id)
+                return None
+            self._http_accessible.add(channel_id)
+
+            if messages:
+                ids = [int(msg.message_id) for msg in messages if msg.message_id]
+                if ids and max(ids) > self._last_seen.get(channel_id, 0):
+                    self._last_seen[channel_id] = max(ids)
+            return messages
+
+    async def _telegram_sender_loop(self):
+        """Коалесцирующая отправка в Telegram: копим сообщения ~1 сек, шлем пачкой
+
+        Вместо отдельного вызова API на каждое сообщение собираем до 30
+        сообщений за окно, send_messages дальше сам группирует их по топикам.
+        """
+        while self.running:
+            try:
+                batch = [await self._outbound.get()]
+                deadline = asyncio.get_event_loop().time() + 1.0
+
+                while len(batch) < 30:
+                    timeout = deadline - asyncio.get_event_loop().time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._outbound.get(), timeout=timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                # Отбрасываем сообщения, уже пересланные другим путем
+                fresh = []
+                for msg in batch:
+                    if msg.message_id is not None:
+                        if msg.message_id in self._sent_ids:
+                            continue
+                        self._sent_ids[msg.message_id] = None
+                    fresh.append(msg)
+
+                while len(self._sent_ids) > self._sent_ids_max:
+                    self._sent_ids.popitem(last=False)
+
+                if not fresh:
+                    continue
+
+                # Единственная точка санитизации контента: сюда стекаются
+                # все пути доставки, а отброшенные выше дубликаты и
+                # отфильтрованные сообщения не платят за очистку
+                # Локальные ссылки - без повторного поиска атрибутов self
+                # на каждом сообщении пачки
+                encode_string = self.safe_encode_string
+                encode_name = self.safe_encode_name
+                for msg in fresh:
+                    msg.content = encode_string(msg.content)
+                    # Авторы повторяются в announcement-каналах - кэш попадает часто
+                    msg.author = encode_name(msg.author)
+
+                fresh.sort(key=attrgetter('epoch'))
+
+                # Темп под глобальный лимит Telegram: ждем токены на всю
+                # пачку до отправки, чтобы send_messages не ловил 429
+                await self._tg_bucket.acquire(len(fresh))
+                await asyncio.to_thread(self.telegram_bot.send_messages, fresh)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error_msg = str(e).encode('utf-8', 'replace').decode('utf-8')
+                logger.error(f"Error in Telegram sender loop: {error_msg}")
+
+    async def initial_sync_enhanced(self):
         """Улучшенная начальная синхронизация с полным обнаружением"""
         try:
             # Шаг 1: Обнаруживаем ВСЕ серверы (не только настроенные)
             logger.info("🔍 Step 1: Discovering ALL servers...")
-            discovered_servers = self.discover_all_servers()
+            discovered_servers = await asyncio.to_thread(self.discover_all_servers)
             
             if not discovered_servers:
                 logger.warning("⚠️ No servers discovered, using existing config")
@@ -202,81 +412,82 @@ class EnhancedDiscordTelegramParser:
             
             # Шаг 3: Получаем последние сообщения из HTTP-доступных каналов
             logger.info("📥 Step 3: Smart initial sync (HTTP-accessible channels)...")
-            messages = []
+            # Группируем по серверам сразу при сборе - без общего слияния
+            # и повторной раскладки вторым проходом
+            server_batches = defaultdict(list)
             http_channels = []
             websocket_only_channels = []
-            
-            for server, channels in discovered_servers.items():
-                if not channels:
-                    continue
-                
-                safe_server = self.safe_encode_string(server)
-                    
-                for channel_id, channel_name in channels.items():
-                    safe_channel = self.safe_encode_string(channel_name)
-                    
-                    # Тест HTTP доступности
-                    if self.test_channel_http_access(channel_id):
-                        try:
-                            recent_messages = self.discord_parser.parse_announcement_channel(
-                                channel_id, 
-                                safe_server,
-                                safe_channel,
-                                limit=3  # Меньше сообщений для быстрого старта
-                            )
-                            
-                            # Очистка контента от проблем с кодировкой
-                            for msg in recent_messages:
-                                msg.content = self.safe_encode_string(msg.content)
-                                msg.author = self.safe_encode_string(msg.author)
-                                msg.server_name = self.safe_encode_string(msg.server_name)
-                                msg.channel_name = self.safe_encode_string(msg.channel_name)
-                            
-                            messages.extend(recent_messages)
-                            http_channels.append((safe_server, safe_channel))
-                            logger.info(f"✅ HTTP sync: {safe_server}#{safe_channel} - {len(recent_messages)} messages")
-                            
-                        except Exception as channel_error:
-                            safe_error = str(channel_error).encode('utf-8', 'replace').decode('utf-8')
-                            logger.warning(f"❌ HTTP sync failed: {safe_server}#{safe_channel}: {safe_error}")
-                            websocket_only_channels.append((safe_server, safe_channel))
-                    else:
-                        websocket_only_channels.append((safe_server, safe_channel))
-                        logger.info(f"🔌 WebSocket only: {safe_server}#{safe_channel} - will monitor via WebSocket")
+
+            # Параллельная выборка всех каналов (семафор ограничивает нагрузку на Discord)
+            sem = asyncio.Semaphore(8)
+            channel_jobs = []
+            for server, channel_id, safe_server, safe_channel in self._channel_list:
+                task = asyncio.create_task(self._fetch_channel_messages(
+                    sem, channel_id, safe_server, safe_channel,
+                    3  # Меньше сообщений для быстрого старта
+                ))
+                channel_jobs.append((safe_server, safe_channel, task))
+
+            results = await asyncio.gather(
+                *(task for _, _, task in channel_jobs),
+                return_exceptions=True
+            )
+
+            for (safe_server, safe_channel, _), result in zip(channel_jobs, results):
+                if isinstance(result, BaseException):
+                    safe_error = str(result).encode('utf-8', 'replace').decode('utf-8')
+                    logger.warning(f"❌ HTTP sync failed: {safe_server}#{safe_channel}: {safe_error}")
+                    websocket_only_channels.append((safe_server, safe_channel))
+                elif result is None:
+                    websocket_only_channels.append((safe_server, safe_channel))
+                    # Позиционные аргументы - формат только если запись не отфильтрована
+                    logger.info("🔌 WebSocket only: {}#{} - will monitor via WebSocket", safe_server, safe_channel)
+                else:
+                    recent_messages = result
+
+                    # Имена присваиваем готовыми; контент/автора чистит
+                    # отправитель Telegram непосредственно перед отправкой
+                    for msg in recent_messages:
+                        msg.server_name = safe_server
+                        msg.channel_name = safe_channel
+
+                    server_batches[safe_server].append(recent_messages)
+                    http_channels.append((safe_server, safe_channel))
+                    logger.info("✅ HTTP sync: {}#{} - {} messages", safe_server, safe_channel, len(recent_messages))
             
             # Шаг 4: Статистика и отправка сообщений
             logger.info(f"📊 Enhanced initial sync summary:")
             logger.info(f"   📁 Total servers discovered: {len(discovered_servers)}")
             logger.info(f"   ✅ HTTP synced: {len(http_channels)} channels")
             logger.info(f"   🔌 WebSocket only: {len(websocket_only_channels)} channels")
-            logger.info(f"   📨 Total messages: {len(messages)}")
+            total_messages = sum(
+                len(batch)
+                for batches in server_batches.values()
+                for batch in batches
+            )
+            logger.info(f"   📨 Total messages: {total_messages}")
             logger.info(f"   🔍 Auto-discovery: ENABLED for real-time detection")
             
             if websocket_only_channels:
-                logger.info(f"🔌 These channels will be monitored via WebSocket only:")
-                for server, channel in websocket_only_channels[:10]:  # Показываем первые 10
-                    logger.info(f"   • {server}#{channel}")
+                # Поканальный список - диагностика: на DEBUG и через islice,
+                # чтобы не копировать срез и не форматировать зря на INFO
+                logger.debug("🔌 These channels will be monitored via WebSocket only:")
+                for server, channel in islice(websocket_only_channels, 10):
+                    logger.debug("   • {}#{}", server, channel)
                 if len(websocket_only_channels) > 10:
-                    logger.info(f"   • ... and {len(websocket_only_channels) - 10} more")
+                    logger.debug("   • ... and {} more", len(websocket_only_channels) - 10)
             
-            # Группируем сообщения по серверам и отправляем в Telegram
-            if messages:
-                messages.sort(key=lambda x: x.timestamp)
-                
-                server_messages = {}
-                for msg in messages:
-                    server = msg.server_name
-                    if server not in server_messages:
-                        server_messages[server] = []
-                    server_messages[server].append(msg)
-                
-                logger.info(f"📤 Sending messages for {len(server_messages)} servers...")
-                
-                for server, msgs in server_messages.items():
-                    logger.info(f"   📍 {server}: {len(msgs)} messages")
-                    self.telegram_bot.send_messages(msgs)
-                
-                logger.success(f"✅ Enhanced initial sync completed: {len(messages)} messages sent")
+            # Сообщения уже сгруппированы по серверам - отправляем в Telegram
+            if server_batches:
+                logger.info(f"📤 Sending messages for {len(server_batches)} servers...")
+
+                for server, batches in server_batches.items():
+                    # Пачки каналов уже отсортированы парсером - сливаем за O(N log k)
+                    logger.info("   📍 {}: {} messages", server, sum(map(len, batches)))
+                    for msg in heapq.merge(*batches, key=attrgetter('epoch')):
+                        await self._outbound.put(msg)
+
+                logger.success(f"✅ Enhanced initial sync completed: {total_messages} messages queued")
             else:
                 logger.info("ℹ️ No HTTP messages found during initial sync")
             
@@ -289,148 +500,211 @@ class EnhancedDiscordTelegramParser:
                 error_msg = "Enhanced initial sync error (encoding issue)"
             logger.error(f"❌ Error in enhanced initial sync: {error_msg}")
     
-    def enhanced_fallback_polling_loop(self):
+    async def enhanced_fallback_polling_loop(self):
         """Улучшенный резервный поллинг с управлением нагрузкой"""
+        poll_interval = 600  # Проверяем каждые 10 минут (меньше нагрузки)
+
+        # Якорим расписание на monotonic, чтобы длительность цикла
+        # не накапливалась как дрейф интервала
+        next_wakeup = time.monotonic() + poll_interval
+
         while self.running:
             try:
-                time.sleep(600)  # Проверяем каждые 10 минут (меньше нагрузки)
-                
+                await asyncio.sleep(max(0, next_wakeup - time.monotonic()))
+                next_wakeup += poll_interval
+
                 if not config.SERVER_CHANNEL_MAPPINGS:
                     continue
                 
                 logger.debug("🔄 Enhanced fallback polling check...")
-                
-                server_messages = {}
+
+                server_messages = defaultdict(list)
                 recent_threshold = datetime.now().timestamp() - 300  # 5 минут назад
                 
-                # Проверяем только HTTP-доступные каналы для экономии ресурсов
-                http_channels_checked = 0
-                for server, channels in config.SERVER_CHANNEL_MAPPINGS.items():
-                    safe_server = self.safe_encode_string(server)
-                    
-                    for channel_id, channel_name in channels.items():
-                        # Пропускаем каналы, доступные только через WebSocket
-                        if not self.test_channel_http_access(channel_id):
-                            continue
-                            
-                        http_channels_checked += 1
-                        if http_channels_checked > 20:  # Ограничиваем нагрузку
-                            break
-                            
-                        try:
-                            safe_channel = self.safe_encode_string(channel_name)
-                            
-                            recent_messages = self.discord_parser.parse_announcement_channel(
-                                channel_id, 
-                                safe_server,
-                                safe_channel,
-                                limit=2  # Еще меньше сообщений для резервного поллинга
-                            )
-                            
-                            # Очистка контента
-                            for msg in recent_messages:
-                                msg.content = self.safe_encode_string(msg.content)
-                                msg.author = self.safe_encode_string(msg.author)
-                                msg.server_name = self.safe_encode_string(msg.server_name)
-                                msg.channel_name = self.safe_encode_string(msg.channel_name)
-                            
-                            # Фильтруем очень свежие сообщения
-                            new_messages = [
-                                msg for msg in recent_messages
-                                if msg.timestamp.timestamp() > recent_threshold
-                            ]
-                            
-                            if new_messages:
-                                if safe_server not in server_messages:
-                                    server_messages[safe_server] = []
-                                server_messages[safe_server].extend(new_messages)
-                            
-                        except Exception as e:
-                            logger.debug(f"Fallback polling error for {safe_server}#{safe_channel}: {e}")
-                            continue
-                    
-                    if http_channels_checked > 20:
-                        break
+                # Раз в час перепроверяем недоступные каналы - могли "ожить"
+                recheck_due = time.monotonic() >= self._next_http_recheck
+                if recheck_due:
+                    self._next_http_recheck = time.monotonic() + self._http_recheck_interval
+
+                # Окно из 20 каналов с персистентным курсором: кап тот же,
+                # но поздние серверы больше не остаются без поллинга.
+                # Маппинги могут быть непустыми при пустом плоском списке
+                # (сервер с пустым словарем каналов в sidecar)
+                channel_count = len(self._channel_list)
+                if not channel_count:
+                    continue
+                start = self._poll_cursor % channel_count
+                window_size = min(20, channel_count)
+                window = [
+                    self._channel_list[(start + i) % channel_count]
+                    for i in range(window_size)
+                ]
+                self._poll_cursor = (start + window_size) % channel_count
+
+                # Проверяем каналы параллельно, кап ограничивает нагрузку
+                sem = asyncio.Semaphore(8)
+                fallback_jobs = []
+                for server, channel_id, safe_server, safe_channel in window:
+                    # Вердикт HTTP-пробы уже известен с начальной синхронизации -
+                    # недоступные каналы пропускаем без запроса до переоценки по TTL
+                    accessible = channel_id in self._http_accessible
+                    if not accessible and not recheck_due:
+                        continue
+
+                    task = asyncio.create_task(self._fetch_channel_messages(
+                        sem, channel_id, safe_server, safe_channel,
+                        2,  # Еще меньше сообщений для резервного поллинга
+                        use_after=True  # Тихие каналы вернут пустой ответ
+                    ))
+                    fallback_jobs.append((safe_server, safe_channel, task))
+
+                results = await asyncio.gather(
+                    *(task for _, _, task in fallback_jobs),
+                    return_exceptions=True
+                )
+
+                for (safe_server, safe_channel, _), result in zip(fallback_jobs, results):
+                    if isinstance(result, BaseException):
+                        # Позиционные аргументы: loguru форматирует строку только
+                        # если DEBUG реально включен, f-string платила бы всегда
+                        logger.debug("Fallback polling error for {}#{}: {}", safe_server, safe_channel, result)
+                        continue
+                    if result is None:
+                        # Канал доступен только через WebSocket - пропускаем
+                        continue
+
+                    recent_messages = result
+
+                    # Имена берем готовыми; контент/автора санитизирует
+                    # отправитель - отфильтрованные по времени сообщения
+                    # вообще не платят за очистку
+                    for msg in recent_messages:
+                        msg.server_name = safe_server
+                        msg.channel_name = safe_channel
+
+                    # Фильтруем очень свежие сообщения (epoch посчитан при создании,
+                    # без повторной конвертации datetime -> float на каждое сообщение)
+                    new_messages = [
+                        msg for msg in recent_messages
+                        if msg.epoch > recent_threshold
+                    ]
+
+                    if new_messages:
+                        server_messages[safe_server].append(new_messages)
                 
                 # Отправляем найденные сообщения
                 if server_messages:
-                    total_messages = sum(len(msgs) for msgs in server_messages.values())
+                    total_messages = sum(
+                        len(batch)
+                        for batches in server_messages.values()
+                        for batch in batches
+                    )
                     logger.info(f"🔄 Fallback polling found {total_messages} new messages in {len(server_messages)} servers")
-                    
-                    for server, msgs in server_messages.items():
-                        msgs.sort(key=lambda x: x.timestamp)
-                        logger.info(f"   📍 {server}: {len(msgs)} messages")
-                        self.telegram_bot.send_messages(msgs)
-                
+
+                    for server, batches in server_messages.items():
+                        # Пачки каналов уже отсортированы - сливаем вместо sort
+                        logger.info("   📍 {}: {} messages", server, sum(map(len, batches)))
+                        for msg in heapq.merge(*batches, key=attrgetter('epoch')):
+                            await self._outbound.put(msg)
+
             except Exception as e:
                 error_msg = str(e).encode('utf-8', 'replace').decode('utf-8')
                 logger.error(f"Error in enhanced fallback polling: {error_msg}")
-                time.sleep(120)  # Больше ждем при ошибке
-    
+                await asyncio.sleep(120)  # Больше ждем при ошибке
+                next_wakeup = time.monotonic() + poll_interval
+
+    async def _run_async(self):
+        """Все компоненты на одном asyncio loop вместо отдельных потоков"""
+        # Дефолтный executor (min(32, cpu+4) потоков) тесен для параллельных
+        # HTTP выборок по 50+ каналам - ставим общий пул под I/O-нагрузку
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(
+            ThreadPoolExecutor(max_workers=64, thread_name_prefix='discord-io')
+        )
+
+        # Отправитель Telegram запускаем первым - он разбирает очередь сообщений
+        sender_task = asyncio.create_task(self._telegram_sender_loop())
+
+        # Выполняем улучшенную начальную синхронизацию
+        logger.info("🚀 Starting enhanced initial sync with full server discovery...")
+        await self.initial_sync_enhanced()
+
+        # Telegram bot блокирующий (polling) - выносим в поток через to_thread
+        bot_task = asyncio.create_task(asyncio.to_thread(self.telegram_bot.start_bot))
+        logger.success("✅ Telegram bot started with enhanced features")
+
+        # WebSocket сервис работает прямо на основном loop
+        websocket_task = asyncio.create_task(self.websocket_main_loop())
+        logger.success("✅ Enhanced WebSocket service started with auto-discovery")
+
+        # Резервный поллинг тоже на основном loop
+        fallback_task = asyncio.create_task(self.enhanced_fallback_polling_loop())
+        logger.success("✅ Enhanced fallback polling started")
+
+        # Сохраняем статистику автообнаружения
+        discovery_stats = self.websocket_service.get_discovery_stats()
+
+        # Основной цикл
+        logger.success("🎉 Enhanced Discord Telegram Parser running!")
+        logger.info("📊 Enhanced Features:")
+        logger.info("   🔍 FULL server auto-discovery (finds ALL 15+ servers)")
+        logger.info("   ⚡ Real-time new server detection via WebSocket")
+        logger.info("   📋 One server = One topic (no duplicates)")
+        logger.info("   🧵 Thread-safe topic creation")
+        logger.info("   🧹 Auto-cleanup of invalid topics")
+        logger.info("   🌐 HTTP channels: Initial sync + smart fallback polling")
+        logger.info("   📡 WebSocket channels: Real-time monitoring")
+        logger.info("   📁 Messages grouped by server")
+        logger.info("   💾 Auto-save updated configuration")
+        logger.info(f"   📊 Current stats: {discovery_stats['known_servers']} servers, {discovery_stats['subscribed_channels']} channels")
+        logger.info("   🚨 Automatic notifications for new servers")
+        logger.info("Press Ctrl+C to stop")
+
+        # Периодическая статистика отдельной задачей, главная корутина
+        # просто блокируется на событии остановки (никаких 1-5с пробуждений)
+        stats_task = asyncio.create_task(self._stats_loop())
+
+        try:
+            # Остановка приходит сюда как KeyboardInterrupt/отмена от
+            # asyncio.run - событие лишь держит главную корутину спящей
+            await self._stop_event.wait()
+        finally:
+            for task in (fallback_task, websocket_task, bot_task, sender_task, stats_task):
+                task.cancel()
+
+            # cancel() не прерывает блокирующий polling-поток бота -
+            # без stop_polling() asyncio.run вечно ждет executor на выходе
+            try:
+                self.telegram_bot.bot.stop_polling()
+            except Exception as e:
+                logger.error(f"Error stopping Telegram polling: {e}")
+
+            # Останавливаем WebSocket сервис
+            if self.websocket_service:
+                await self.websocket_service.stop()
+
+    async def _stats_loop(self):
+        """Периодический вывод статистики (каждые 5 минут)"""
+        while self.running:
+            await asyncio.sleep(300)
+            stats = self.websocket_service.get_discovery_stats()
+            logger.info(f"📊 Stats: {stats['known_servers']} servers, {stats['subscribed_channels']} channels, auto-discovery: {stats['auto_discovery_enabled']}")
+
     def run(self):
-        """Запуск всех компонентов с улучшенными возможностями"""
+        """Запуск всех компонентов на одном asyncio event loop"""
         self.running = True
-        
+
+        if uvloop is not None:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            logger.info("⚡ uvloop event loop policy installed")
+
         try:
-            # Выполняем улучшенную начальную синхронизацию
-            logger.info("🚀 Starting enhanced initial sync with full server discovery...")
-            self.initial_sync_enhanced()
-            
-            # Запускаем Telegram bot в отдельном потоке
-            bot_thread = threading.Thread(
-                target=self.telegram_bot.start_bot,
-                daemon=True
-            )
-            bot_thread.start()
-            logger.success("✅ Telegram bot started with enhanced features")
-            
-            # Запускаем улучшенный WebSocket сервис в отдельном потоке
-            websocket_thread = self.run_websocket_in_thread()
-            logger.success("✅ Enhanced WebSocket service started with auto-discovery")
-            
-            # Запускаем улучшенный резервный поллинг в отдельном потоке
-            fallback_thread = threading.Thread(
-                target=self.enhanced_fallback_polling_loop,
-                daemon=True
-            )
-            fallback_thread.start()
-            logger.success("✅ Enhanced fallback polling started")
-            
-            # Сохраняем статистику автообнаружения
-            discovery_stats = self.websocket_service.get_discovery_stats()
-            
-            # Основной цикл
-            logger.success("🎉 Enhanced Discord Telegram Parser running!")
-            logger.info("📊 Enhanced Features:")
-            logger.info("   🔍 FULL server auto-discovery (finds ALL 15+ servers)")
-            logger.info("   ⚡ Real-time new server detection via WebSocket")
-            logger.info("   📋 One server = One topic (no duplicates)")
-            logger.info("   🧵 Thread-safe topic creation")
-            logger.info("   🧹 Auto-cleanup of invalid topics")
-            logger.info("   🌐 HTTP channels: Initial sync + smart fallback polling")
-            logger.info("   📡 WebSocket channels: Real-time monitoring")
-            logger.info("   📁 Messages grouped by server")
-            logger.info("   💾 Auto-save updated configuration")
-            logger.info(f"   📊 Current stats: {discovery_stats['known_servers']} servers, {discovery_stats['subscribed_channels']} channels")
-            logger.info("   🚨 Automatic notifications for new servers")
-            logger.info("Press Ctrl+C to stop")
-            
-            while self.running:
-                time.sleep(5)
-                
-                # Периодически выводим статистику (каждые 5 минут)
-                if int(time.time()) % 300 == 0:
-                    stats = self.websocket_service.get_discovery_stats()
-                    logger.info(f"📊 Stats: {stats['known_servers']} servers, {stats['subscribed_channels']} channels, auto-discovery: {stats['auto_discovery_enabled']}")
-                
+            asyncio.run(self._run_async())
         except KeyboardInterrupt:
+            # К этому моменту loop уже разобран - вся очистка выполнена
+            # в finally внутри _run_async
             logger.info("Shutting down enhanced parser...")
             self.running = False
-            
-            # Останавливаем WebSocket сервис
-            if self.websocket_service:
-                asyncio.run(self.websocket_service.stop())
-                
         except Exception as e:
             error_msg = str(e).encode('utf-8', 'replace').decode('utf-8')
             logger.error(f"Error in enhanced main run loop: {error_msg}")
@@ -1,6 +1,11 @@
 import os
 from dotenv import load_dotenv
 
+from discord_telegram_parser.utils.json_io import loads as json_loads
+
+# Sidecar с автообнаруженными маппингами серверов/каналов
+CHANNEL_MAPPINGS_FILE = os.path.join(os.path.dirname(__file__), 'channel_mappings.json')
+
 class Config:
     def __init__(self):
         load_dotenv()
@@ -26,8 +31,14 @@ class Config:
         self.TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '')
         self.TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID', '')
         
-        # Server/Channel Mappings
+        # Server/Channel Mappings (загружаются из JSON sidecar, если он есть)
         self.SERVER_CHANNEL_MAPPINGS = {}
+        if os.path.exists(CHANNEL_MAPPINGS_FILE):
+            try:
+                with open(CHANNEL_MAPPINGS_FILE, 'rb') as f:
+                    self.SERVER_CHANNEL_MAPPINGS = json_loads(f.read())
+            except (OSError, ValueError) as e:
+                print(f"Error loading channel mappings: {e}")
         
         # Telegram UI Preferences
         self.TELEGRAM_UI_PREFERENCES = {
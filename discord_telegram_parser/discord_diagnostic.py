@@ -5,34 +5,93 @@
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import heapq
 import json
 import os
+import re
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from loguru import logger
 from dotenv import load_dotenv
 from discord_telegram_parser.config.settings import config
+from discord_telegram_parser.utils.json_io import dumps_indented, loads as json_loads
+
+# Дисковый кэш ответов /guilds/{id}/channels: Discord отдает ETag, и при
+# If-None-Match отвечает 304 без тела - повторные прогоны диагностики
+# не платят ни за трафик, ни за разбор JSON
+CHANNELS_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'discord_diag', 'channels')
+
+# Снапшот обнаруженных серверов: соседние вызовы CLI (--generate, потом
+# --config) переиспользуют результат вместо сотен повторных запросов
+STATE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'discord_diag', 'state.json')
+STATE_TTL = 300  # секунд
+
+# Ключевые слова announcement-каналов в порядке приоритета. Одна
+# скомпилированная альтернация заменяет до 8 подстрочных проверок на
+# канал: номер сработавшей группы дает индекс ключевого слова
+_PRIORITY_KEYWORDS = (
+    'announcements',
+    'announcement',
+    'news',
+    'updates',
+    'important',
+    'официальные',
+    'объявления',
+    'важное'
+)
+_KEYWORD_RE = re.compile('|'.join(f'({re.escape(k)})' for k in _PRIORITY_KEYWORDS))
 
 class EnhancedDiagnosticTool:
-    def __init__(self):
+    def __init__(self, use_cache=True):
         load_dotenv()
         self.tokens = [t.strip() for t in os.getenv('DISCORD_AUTH_TOKENS', '').split(',') if t.strip()]
         self.sessions = []
         self.guild_data = {}
+        self.use_cache = use_cache
         
         # Инициализируем сессии
         self._init_sessions()
+
+        # Индексы для O(1) поиска вместо линейных сканов next(...)
+        self._session_by_username = {
+            s['user_info']['username']: s for s in self.sessions if s['valid']
+        }
+        self._guild_by_name = {}
+
+        # Превентивный учет X-RateLimit-*: метка "раньше не ходить" на
+        # сессию, чтобы параллельные воркеры одного токена не ловили 429
+        self._limit_lock = threading.Lock()
+        self._next_allowed = {}
+
+        if use_cache:
+            self._load_state()
     
     def _init_sessions(self):
         """Инициализация сессий для каждого токена"""
         for token in self.tokens:
             session = requests.Session()
-            session.headers = {'Authorization': token}
-            
+            # Все запросы идут на discord.com - держим keep-alive пул под
+            # параллельных воркеров вместо TLS-рукопожатия на каждый запрос
+            adapter = HTTPAdapter(
+                pool_connections=32,
+                pool_maxsize=64,
+                max_retries=Retry(total=0)
+            )
+            session.mount('https://', adapter)
+            session.headers.update({
+                'Authorization': token,
+                'Accept-Encoding': 'gzip'
+            })
+
             try:
                 r = session.get('https://discord.com/api/v9/users/@me')
                 if r.status_code == 200:
-                    user_info = r.json()
+                    user_info = json_loads(r.content)
                     self.sessions.append({
                         'session': session,
                         'token': token,
@@ -81,24 +140,83 @@ class EnhancedDiagnosticTool:
         
         return len(valid_tokens) > 0
     
+    def _load_state(self):
+        """Загрузка недавнего снапшота обнаружения с диска"""
+        try:
+            if time.time() - os.path.getmtime(STATE_FILE) > STATE_TTL:
+                return
+            with open(STATE_FILE, 'r', encoding='utf-8') as f:
+                self.guild_data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        self._guild_by_name = {
+            g['guild_info']['name']: g for g in self.guild_data.values()
+        }
+        logger.info(f"💾 Reusing discovery snapshot: {len(self.guild_data)} guilds (<{STATE_TTL}s old)")
+
+    def _save_state(self):
+        """Сохранение снапшота обнаружения для соседних вызовов CLI"""
+        try:
+            os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+            with open(STATE_FILE, 'w', encoding='utf-8') as f:
+                json.dump(self.guild_data, f, ensure_ascii=False)
+        except OSError:
+            pass
+
+    def _pause_if_limited(self, session):
+        """Пауза перед запросом, если бюджет сессии уже исчерпан"""
+        delay = self._next_allowed.get(id(session), 0.0) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _respect_limits(self, session, r):
+        """Чтение X-RateLimit-* после ответа - пауза до 429, а не после
+
+        Discord присылает Remaining/Reset-After в каждом ответе; при
+        исчерпании бюджета откладываем следующий запрос этой сессии
+        вместо того, чтобы платить за отклоненный запрос и retry_after.
+        """
+        try:
+            remaining = int(r.headers.get('X-RateLimit-Remaining', 1))
+            reset_after = float(r.headers.get('X-RateLimit-Reset-After', 0))
+        except (TypeError, ValueError):
+            return
+
+        if remaining == 0 and reset_after > 0:
+            with self._limit_lock:
+                until = time.monotonic() + reset_after
+                if until > self._next_allowed.get(id(session), 0.0):
+                    self._next_allowed[id(session)] = until
+
     def discover_all_guilds(self):
         """Обнаружение всех серверов со всех аккаунтов"""
         logger.info("🏰 Discovering all guilds across all accounts...")
         
         all_guilds = {}
         total_unique_guilds = 0
-        
-        for session_data in self.sessions:
-            if not session_data['valid']:
-                continue
-                
-            session = session_data['session']
-            username = session_data['user_info']['username']
-            
-            try:
-                guilds = self._get_all_guilds_paginated(session)
+
+        # Токены независимы - пагинацию по /users/@me/guilds каждого аккаунта
+        # гоняем в своем потоке, слияние делаем в главном потоке без блокировок
+        valid = [s for s in self.sessions if s['valid']]
+        with ThreadPoolExecutor(max_workers=max(4, len(valid))) as executor:
+            futures = {
+                executor.submit(self._get_all_guilds_paginated, s['session']): s
+                for s in valid
+            }
+
+            for future in as_completed(futures):
+                session_data = futures[future]
+                username = session_data['user_info']['username']
+
+                try:
+                    guilds = future.result()
+                except Exception as e:
+                    logger.error(f"❌ Error getting guilds for {username}: {e}")
+                    continue
+
                 logger.info(f"🏰 {username}: found {len(guilds)} guilds")
-                
+
                 for guild in guilds:
                     guild_id = guild['id']
                     if guild_id not in all_guilds:
@@ -108,13 +226,13 @@ class EnhancedDiagnosticTool:
                             'announcement_channels': {}
                         }
                         total_unique_guilds += 1
-                    
+
                     all_guilds[guild_id]['accessible_via'].append(username)
-                    
-            except Exception as e:
-                logger.error(f"❌ Error getting guilds for {username}: {e}")
         
         self.guild_data = all_guilds
+        self._guild_by_name = {
+            g['guild_info']['name']: g for g in all_guilds.values()
+        }
         logger.success(f"🎉 Discovery complete: {total_unique_guilds} unique guilds found")
         
         return all_guilds
@@ -127,9 +245,12 @@ class EnhancedDiagnosticTool:
         page = 1
         while url:
             try:
+                self._pause_if_limited(session)
                 r = session.get(url)
+                self._respect_limits(session, r)
                 if r.status_code == 200:
-                    batch = r.json()
+                    # Крупнейшие ответы модуля - разбираем bytes напрямую orjson-ом
+                    batch = json_loads(r.content)
                     guilds.extend(batch)
                     logger.debug(f"   Page {page}: {len(batch)} guilds")
                     
@@ -147,7 +268,7 @@ class EnhancedDiagnosticTool:
                         url = None
                         
                 elif r.status_code == 429:
-                    retry_after = float(r.json().get('retry_after', 1))
+                    retry_after = float(json_loads(r.content).get('retry_after', 1))
                     logger.warning(f"   Rate limited, waiting {retry_after}s...")
                     time.sleep(retry_after)
                     continue
@@ -171,40 +292,38 @@ class EnhancedDiagnosticTool:
         servers_with_announcements = 0
         total_announcement_channels = 0
         
+        # Серверы независимы - тянем списки каналов параллельно,
+        # а логирование и запись в guild_data оставляем главному потоку
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = {
+                executor.submit(self._fetch_guild_announcements, guild_id, guild_data['accessible_via']): guild_id
+                for guild_id, guild_data in self.guild_data.items()
+            }
+            results = {futures[f]: f.result() for f in as_completed(futures)}
+
         for guild_id, guild_data in self.guild_data.items():
             guild_info = guild_data['guild_info']
             guild_name = guild_info['name']
             accessible_via = guild_data['accessible_via']
-            
-            # Пробуем получить каналы через доступные аккаунты
-            announcement_channels = {}
-            
-            for username in accessible_via:
-                session_data = next(s for s in self.sessions if s['user_info']['username'] == username)
-                session = session_data['session']
-                
-                try:
-                    channels = self._get_guild_channels(session, guild_id)
-                    if channels:
-                        announcement_channels = self._filter_announcement_channels(channels)
-                        break
-                except Exception as e:
-                    logger.debug(f"   Failed to get channels via {username}: {e}")
-                    continue
-            
+            announcement_channels = results.get(guild_id, {})
+
             if announcement_channels:
                 servers_with_announcements += 1
                 total_announcement_channels += len(announcement_channels)
                 
-                logger.info(f"✅ {guild_name}:")
-                logger.info(f"   📊 Accessible via: {', '.join(accessible_via)}")
-                logger.info(f"   📢 Announcement channels: {len(announcement_channels)}")
-                
+                # Один вызов логгера на сервер вместо 3+N: меньше захватов
+                # блокировки и записей в sink, блок не перемешивается
+                lines = [
+                    f"✅ {guild_name}:",
+                    f"   📊 Accessible via: {', '.join(accessible_via)}",
+                    f"   📢 Announcement channels: {len(announcement_channels)}"
+                ]
                 for channel_id, channel_info in announcement_channels.items():
                     priority = channel_info.get('priority', 'unknown')
                     channel_type = 'Announcement' if channel_info['type'] == 5 else 'Text'
-                    logger.info(f"      • {channel_info['name']} (ID: {channel_id}, Type: {channel_type}, Priority: {priority})")
-                
+                    lines.append(f"      • {channel_info['name']} (ID: {channel_id}, Type: {channel_type}, Priority: {priority})")
+                logger.info('\n'.join(lines))
+
                 # Сохраняем в guild_data
                 guild_data['announcement_channels'] = announcement_channels
             else:
@@ -215,15 +334,65 @@ class EnhancedDiagnosticTool:
         logger.info(f"   📢 Servers with announcements: {servers_with_announcements}")
         logger.info(f"   📈 Total announcement channels: {total_announcement_channels}")
         logger.info(f"   📊 Coverage: {servers_with_announcements/len(self.guild_data)*100:.1f}%")
-        
+
+        self._save_state()
+
         return servers_with_announcements, total_announcement_channels
-    
+
+    def _fetch_guild_announcements(self, guild_id, accessible_via):
+        """Получение и фильтрация announcement каналов одного сервера"""
+        for username in accessible_via:
+            # accessible_via может прийти из снапшота на диске - токена
+            # этого пользователя в текущем окружении может уже не быть
+            token_info = self._session_by_username.get(username)
+            if token_info is None:
+                continue
+            session = token_info['session']
+
+            try:
+                channels = self._get_guild_channels(session, guild_id)
+                if channels:
+                    return self._filter_announcement_channels(channels)
+            except Exception as e:
+                logger.debug(f"   Failed to get channels via {username}: {e}")
+                continue
+
+        return {}
+
     def _get_guild_channels(self, session, guild_id):
-        """Получение каналов сервера"""
+        """Получение каналов сервера (с ETag-кэшем на диске)"""
+        cache_path = os.path.join(CHANNELS_CACHE_DIR, f'{guild_id}.json')
+        cached = None
+        headers = {}
+
+        if self.use_cache:
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    cached = json.load(f)
+                headers['If-None-Match'] = cached['etag']
+            except (OSError, ValueError, KeyError):
+                cached = None
+
         try:
-            r = session.get(f'https://discord.com/api/v9/guilds/{guild_id}/channels')
+            self._pause_if_limited(session)
+            r = session.get(
+                f'https://discord.com/api/v9/guilds/{guild_id}/channels',
+                headers=headers
+            )
+            self._respect_limits(session, r)
+            if r.status_code == 304 and cached:
+                return cached['body']
             if r.status_code == 200:
-                return r.json()
+                channels = json_loads(r.content)
+                etag = r.headers.get('ETag')
+                if etag:
+                    try:
+                        os.makedirs(CHANNELS_CACHE_DIR, exist_ok=True)
+                        with open(cache_path, 'w', encoding='utf-8') as f:
+                            json.dump({'etag': etag, 'body': channels}, f, ensure_ascii=False)
+                    except OSError:
+                        pass
+                return channels
             elif r.status_code == 403:
                 return None  # Нет доступа
             else:
@@ -236,18 +405,7 @@ class EnhancedDiagnosticTool:
     def _filter_announcement_channels(self, channels):
         """Фильтрация announcement каналов"""
         announcement_channels = {}
-        
-        priority_keywords = [
-            'announcements',
-            'announcement', 
-            'news',
-            'updates',
-            'important',
-            'официальные',
-            'объявления',
-            'важное'
-        ]
-        
+
         for channel in channels:
             if channel['type'] not in [0, 5]:  # Только текстовые и announcement каналы
                 continue
@@ -272,23 +430,32 @@ class EnhancedDiagnosticTool:
                 }
                 continue
             
-            # Содержит keywords (приоритет 3+)
-            for i, keyword in enumerate(priority_keywords):
-                if keyword in channel_name:
-                    announcement_channels[channel['id']] = {
-                        'name': channel['name'],
-                        'type': channel['type'],
-                        'priority': 3 + i
-                    }
-                    break
-        
-        # Возвращаем топ-5 каналов по приоритету
-        sorted_channels = dict(sorted(
+            # Содержит keywords (приоритет 3+) - один проход регулярки
+            # вместо перебора списка подстрок. search() вернул бы самое
+            # левое вхождение, а не самое приоритетное, поэтому берем
+            # минимальный номер группы по всем совпадениям
+            best_group = min(
+                (m.lastindex for m in _KEYWORD_RE.finditer(channel_name)),
+                default=None
+            )
+            if best_group is not None:
+                announcement_channels[channel['id']] = {
+                    'name': channel['name'],
+                    'type': channel['type'],
+                    'priority': 3 + best_group - 1
+                }
+
+        # Обычный случай: кандидатов не больше пяти - отбор не нужен
+        if len(announcement_channels) <= 5:
+            return announcement_channels
+
+        # Возвращаем топ-5 каналов по приоритету - nsmallest не сортирует
+        # весь список ради пяти элементов
+        return dict(heapq.nsmallest(
+            5,
             announcement_channels.items(),
             key=lambda x: x[1]['priority']
-        )[:5])
-        
-        return sorted_channels
+        ))
     
     def compare_with_current_config(self):
         """Сравнение обнаруженных серверов с текущей конфигурацией"""
@@ -299,10 +466,11 @@ class EnhancedDiagnosticTool:
             self.analyze_announcement_channels()
         
         # Получаем обнаруженные серверы с announcement каналами
-        discovered_servers = set()
-        for guild_data in self.guild_data.values():
-            if guild_data['announcement_channels']:
-                discovered_servers.add(guild_data['guild_info']['name'])
+        discovered_servers = {
+            g['guild_info']['name']
+            for g in self.guild_data.values()
+            if g['announcement_channels']
+        }
         
         # Получаем серверы из текущей конфигурации
         config_servers = set(config.SERVER_CHANNEL_MAPPINGS.keys())
@@ -322,7 +490,7 @@ class EnhancedDiagnosticTool:
         if missing_from_config:
             logger.warning(f"🆕 Servers missing from config:")
             for server in sorted(missing_from_config):
-                guild_data = next(g for g in self.guild_data.values() if g['guild_info']['name'] == server)
+                guild_data = self._guild_by_name[server]
                 channels_count = len(guild_data['announcement_channels'])
                 logger.warning(f"   • {server} ({channels_count} announcement channels)")
         
@@ -339,56 +507,93 @@ class EnhancedDiagnosticTool:
         
         accessible_channels = []
         inaccessible_channels = []
-        
-        for server_name, channels in config.SERVER_CHANNEL_MAPPINGS.items():
-            if not channels:
-                continue
-                
-            logger.info(f"🏰 Testing {server_name}:")
-            
-            for channel_id, channel_name in channels.items():
-                # Тестируем доступ через все доступные токены
-                access_results = []
-                
-                for session_data in self.sessions:
-                    if not session_data['valid']:
-                        continue
-                        
-                    session = session_data['session']
-                    username = session_data['user_info']['username']
-                    
-                    try:
-                        r = session.get(f'https://discord.com/api/v9/channels/{channel_id}/messages?limit=1')
-                        if r.status_code == 200:
-                            access_results.append(f"✅ {username}")
-                        elif r.status_code == 403:
-                            access_results.append(f"🔒 {username}")
-                        else:
-                            access_results.append(f"❌ {username} (HTTP {r.status_code})")
-                    except Exception as e:
-                        access_results.append(f"❌ {username} (Error)")
-                
-                # Определяем общий статус доступа
-                has_access = any("✅" in result for result in access_results)
-                
+
+        # Каналы проверяем параллельно, а результаты разбираем в исходном
+        # порядке - лог остается сгруппированным по серверам
+        jobs = [
+            (server_name, channel_id, channel_name)
+            for server_name, channels in config.SERVER_CHANNEL_MAPPINGS.items()
+            for channel_id, channel_name in channels.items()
+        ]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [
+                (server_name, channel_id, channel_name,
+                 executor.submit(self._test_single_channel, channel_id))
+                for server_name, channel_id, channel_name in jobs
+            ]
+
+            # Один вызов логгера на сервер вместо строки на канал
+            current_server = None
+            lines = []
+            for server_name, channel_id, channel_name, future in futures:
+                if server_name != current_server:
+                    if lines:
+                        logger.info('\n'.join(lines))
+                    lines = [f"🏰 Testing {server_name}:"]
+                    current_server = server_name
+
+                has_access, access_results = future.result()
+
                 if has_access:
                     accessible_channels.append((server_name, channel_name, channel_id))
-                    logger.info(f"   ✅ {channel_name}: {', '.join(access_results)}")
+                    lines.append(f"   ✅ {channel_name}: {', '.join(access_results)}")
                 else:
                     inaccessible_channels.append((server_name, channel_name, channel_id))
-                    logger.warning(f"   ❌ {channel_name}: {', '.join(access_results)}")
+                    lines.append(f"   ❌ {channel_name}: {', '.join(access_results)}")
+
+            if lines:
+                logger.info('\n'.join(lines))
         
         logger.info(f"📊 Channel Access Summary:")
         logger.info(f"   ✅ Accessible: {len(accessible_channels)}")
         logger.info(f"   ❌ Inaccessible: {len(inaccessible_channels)}")
         
         if inaccessible_channels:
-            logger.warning(f"❌ Inaccessible channels:")
-            for server, channel, channel_id in inaccessible_channels:
-                logger.warning(f"   • {server}#{channel} (ID: {channel_id})")
+            logger.warning('\n'.join(
+                ["❌ Inaccessible channels:"] +
+                [f"   • {server}#{channel} (ID: {channel_id})"
+                 for server, channel, channel_id in inaccessible_channels]
+            ))
         
         return accessible_channels, inaccessible_channels
-    
+
+    def _test_single_channel(self, channel_id):
+        """Проверка доступа к каналу через все валидные токены
+
+        Возвращает `(has_access, access_results)`: флаг известен уже по
+        коду ответа, сканировать отформатированные строки не нужно.
+        """
+        access_results = []
+        has_access = False
+
+        for session_data in self._session_by_username.values():
+            session = session_data['session']
+            username = session_data['user_info']['username']
+
+            try:
+                self._pause_if_limited(session)
+                # Объект канала вместо messages?limit=1: проверка прав
+                # происходит до сборки сообщений, ответ - пара сотен байт
+                r = session.get(f'https://discord.com/api/v9/channels/{channel_id}')
+                self._respect_limits(session, r)
+                if r.status_code == 200:
+                    has_access = True
+                    access_results.append(f"✅ {username}")
+                elif r.status_code == 403:
+                    access_results.append(f"🔒 {username}")
+                else:
+                    access_results.append(f"❌ {username} (HTTP {r.status_code})")
+            except Exception:
+                access_results.append(f"❌ {username} (Error)")
+
+        return has_access, access_results
+
+    def close(self):
+        """Закрытие HTTP-сессий и возврат соединений из пулов"""
+        for session_data in self.sessions:
+            session_data['session'].close()
+
     def generate_new_config(self):
         """Генерация новой конфигурации на основе обнаружения"""
         logger.info("⚙️ Generating new configuration...")
@@ -420,8 +625,12 @@ class EnhancedDiagnosticTool:
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f'discovered_config_{timestamp}.json'
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(new_config, f, indent=2, ensure_ascii=False)
+        # Атомарная запись: временный файл + os.replace, как у сайдкара
+        # маппингов - прерванный прогон не оставит обрезанный конфиг
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'w', encoding='utf-8') as f:
+            f.write(dumps_indented(new_config))
+        os.replace(tmp_filename, filename)
         
         logger.info(f"💾 Configuration saved to: {filename}")
         
@@ -484,24 +693,47 @@ class EnhancedDiagnosticTool:
 
 def main():
     """CLI для запуска диагностики"""
-    if len(sys.argv) > 1:
-        if sys.argv[1] == '--tokens':
-            diagnostic = EnhancedDiagnosticTool()
-            diagnostic.check_tokens()
-        elif sys.argv[1] == '--discovery':
-            diagnostic = EnhancedDiagnosticTool()
-            diagnostic.discover_all_guilds()
-            diagnostic.analyze_announcement_channels()
-        elif sys.argv[1] == '--config':
-            diagnostic = EnhancedDiagnosticTool()
-            diagnostic.compare_with_current_config()
-        elif sys.argv[1] == '--channels':
-            diagnostic = EnhancedDiagnosticTool()
-            diagnostic.test_channel_access()
-        elif sys.argv[1] == '--generate':
-            diagnostic = EnhancedDiagnosticTool()
-            diagnostic.generate_new_config()
-        elif sys.argv[1] == '--help':
+    use_cache = '--no-cache' not in sys.argv[1:]
+    if '--refresh' in sys.argv[1:]:
+        try:
+            os.remove(STATE_FILE)
+        except OSError:
+            pass
+    args = [a for a in sys.argv[1:] if a not in ('--no-cache', '--refresh')]
+
+    if args:
+        if args[0] == '--tokens':
+            diagnostic = EnhancedDiagnosticTool(use_cache=use_cache)
+            try:
+                diagnostic.check_tokens()
+            finally:
+                diagnostic.close()
+        elif args[0] == '--discovery':
+            diagnostic = EnhancedDiagnosticTool(use_cache=use_cache)
+            try:
+                diagnostic.discover_all_guilds()
+                diagnostic.analyze_announcement_channels()
+            finally:
+                diagnostic.close()
+        elif args[0] == '--config':
+            diagnostic = EnhancedDiagnosticTool(use_cache=use_cache)
+            try:
+                diagnostic.compare_with_current_config()
+            finally:
+                diagnostic.close()
+        elif args[0] == '--channels':
+            diagnostic = EnhancedDiagnosticTool(use_cache=use_cache)
+            try:
+                diagnostic.test_channel_access()
+            finally:
+                diagnostic.close()
+        elif args[0] == '--generate':
+            diagnostic = EnhancedDiagnosticTool(use_cache=use_cache)
+            try:
+                diagnostic.generate_new_config()
+            finally:
+                diagnostic.close()
+        elif args[0] == '--help':
             print("🔧 Enhanced Diagnostic Tool")
             print("Usage:")
             print("  python diagnostic_tools.py [option]")
@@ -511,15 +743,20 @@ def main():
             print("  --config     Compare discovered servers with current config")
             print("  --channels   Test access to configured channels")
             print("  --generate   Generate new configuration file")
+            print("  --no-cache   Ignore the on-disk channel list cache")
+            print("  --refresh    Drop the discovery snapshot and re-discover")
             print("  --help       Show this help")
             print("\nRun without arguments for full diagnostic")
         else:
-            print(f"Unknown option: {sys.argv[1]}")
+            print(f"Unknown option: {args[0]}")
             print("Use --help for available options")
     else:
         # Полная диагностика
-        diagnostic = EnhancedDiagnosticTool()
-        diagnostic.run_full_diagnostic()
+        diagnostic = EnhancedDiagnosticTool(use_cache=use_cache)
+        try:
+            diagnostic.run_full_diagnostic()
+        finally:
+            diagnostic.close()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,12 +1,16 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import os
 from datetime import datetime
+from operator import attrgetter
 from time import sleep
 from loguru import logger
 from translatepy.translators.google import GoogleTranslate
 from discord_telegram_parser.models.message import Message
 from discord_telegram_parser.config.settings import config
+from discord_telegram_parser.utils.json_io import loads as json_loads
 
 class DiscordParser:
     def __init__(self):
@@ -16,6 +20,22 @@ class DiscordParser:
         # Initialize sessions for each token
         for token in config.DISCORD_TOKENS:
             session = requests.Session()
+            # Default pool keeps only 10 connections; concurrent channel
+            # fetches evict them and pay a fresh TLS handshake each time.
+            # Size the keep-alive pool to the fetch concurrency, and let
+            # urllib3 retry transient 429/5xx with backoff at the transport
+            # level instead of surfacing them as parse failures.
+            adapter = HTTPAdapter(
+                pool_connections=10,
+                pool_maxsize=64,
+                max_retries=Retry(
+                    total=2,
+                    backoff_factor=0.3,
+                    status_forcelist=[429, 502, 503, 504],
+                    respect_retry_after_header=True
+                )
+            )
+            session.mount('https://', adapter)
             session.headers['authorization'] = token
             
             # Verify token permissions
@@ -38,20 +58,34 @@ class DiscordParser:
                 
             self.sessions.append(session)
     
-    def parse_announcement_channel(self, channel_id, server_name=None, channel_name=None, limit=10):
-        """Parse the last N messages from an announcement channel with token rotation"""
+    def parse_announcement_channel(self, channel_id, server_name=None, channel_name=None, limit=10, after=None, with_status=False):
+        """Parse the last N messages from an announcement channel with token rotation
+
+        When `after` (a message ID) is given, Discord returns only newer
+        messages - an empty array if nothing changed, skipping all parsing.
+        With `with_status=True` returns `(messages, last_status_code)` so the
+        caller can classify channel accessibility from the fetch itself
+        instead of issuing a separate probe request.
+        """
         messages = []
         token_index = 0
         has_more = True
         last_id = None
         count = 0
-        
+        last_status = None
+        rotations = 0
+
         while has_more:
+            # Все токены подряд получили отказ - канал недоступен, выходим
+            if rotations >= len(self.sessions):
+                break
             session = self.sessions[token_index]
             try:
                 # Fetch messages in batches of 10
                 params = {'limit': min(10, limit - count) if limit else 10}
-                if last_id:
+                if after:
+                    params['after'] = after
+                elif last_id:
                     params['before'] = last_id
                     
                 # Stop if we've reached the limit
@@ -62,13 +96,24 @@ class DiscordParser:
                     f'https://discord.com/api/v9/channels/{channel_id}/messages',
                     params=params
                 )
-                
+                last_status = r.status_code
+
                 if r.status_code == 200:
-                    batch = r.json()
+                    rotations = 0
+                    # Горячий путь: orjson разбирает bytes ответа напрямую
+                    batch = json_loads(r.content)
                     if not batch:
                         has_more = False
                         break
-                        
+
+                    # Ответ отсортирован от новых к старым даже с after,
+                    # поэтому курсор продвигаем на максимальный id батча
+                    # (первый элемент) - повторная отправка исходного after
+                    # перечитывала бы одно и то же окно
+                    if after:
+                        after = batch[0]['id']
+
+
                     # Process messages in reverse chronological order (newest first)
                     for msg in batch:
                         msg_time = datetime.fromisoformat(msg['timestamp'])
@@ -84,7 +129,9 @@ class DiscordParser:
                             timestamp=msg_time,
                             server_name=server,
                             channel_name=channel,
-                            author=author
+                            author=author,
+                            message_id=msg['id'],
+                            epoch=msg_time.timestamp()
                         )
                         messages.append(message)
                         last_id = msg['id']
@@ -110,24 +157,30 @@ class DiscordParser:
                     logger.error(f"Access denied to channel {channel_id}")
                     # Rotate token
                     token_index = (token_index + 1) % len(self.sessions)
+                    rotations += 1
                     logger.info(f"Rotating to token {token_index}")
                     continue
-                    
+
                 else:
                     error_details = r.json().get('message', 'Unknown error')
                     logger.error(f"Failed to fetch messages (HTTP {r.status_code}): {error_details}")
                     # Rotate token
                     token_index = (token_index + 1) % len(self.sessions)
+                    rotations += 1
                     logger.info(f"Rotating to token {token_index}")
-                    
+
             except Exception as e:
                 logger.error(f"Error parsing channel {channel_id}: {e}")
                 # Rotate token on any exception
                 token_index = (token_index + 1) % len(self.sessions)
+                rotations += 1
                 logger.info(f"Rotating to token {token_index} after exception")
-                
+
         # Return messages in chronological order (oldest first)
-        return sorted(messages, key=lambda x: x.timestamp)
+        result = sorted(messages, key=attrgetter('epoch'))
+        if with_status:
+            return result, last_status
+        return result
         
     def sanitize_string(self, s):
         """Helper to fix encoding issues"""
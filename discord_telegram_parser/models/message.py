@@ -10,3 +10,5 @@ class Message:
     channel_name: Optional[str] = None
     author: Optional[str] = None
     translated_content: Optional[str] = None
+    message_id: Optional[str] = None
+    epoch: Optional[float] = None  # timestamp.timestamp(), вычислен один раз при создании
@@ -1,45 +1,121 @@
 import asyncio
-import json
+import os
+import random
+import unicodedata
+import zlib
+from collections import OrderedDict
 import aiohttp
 import time
 import threading
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from operator import attrgetter
 from loguru import logger
+from discord_telegram_parser.main import DiscordParser
 from discord_telegram_parser.models.message import Message
-from discord_telegram_parser.config.settings import config
+from discord_telegram_parser.config.settings import config, CHANNEL_MAPPINGS_FILE
+from discord_telegram_parser.utils.channel_id_parser import discover_new_servers_only
+from discord_telegram_parser.utils.json_io import dumps as json_dumps, dumps_indented, loads as json_loads
 
-class DiscordWebSocketService:
+# Одинокие суррогаты вырезаем C-реализованным str.translate вместо
+# пер-символьного generator expression
+_SURROGATE_TABLE = dict.fromkeys(range(0xD800, 0xE000))
+
+# Discord epoch (2015-01-01) в миллисекундах - снежинки кодируют время
+# сообщения в старших битах
+_DISCORD_EPOCH_MS = 1420070400000
+
+class EnhancedDiscordWebSocketService:
     def __init__(self, telegram_bot=None):
         self.telegram_bot = telegram_bot
         self.websockets = []
         self.heartbeat_interval = 41250
-        self.session_id = None
-        self.last_sequence = None
-        self.subscribed_channels = set()
+        # Подписки: пишем во внутренний set, читатели (MESSAGE_CREATE,
+        # diff-синхронизация приложения) видят атомарный frozenset-снимок
+        self._subscribed_set = set()
+        self.subscribed_channels = frozenset()
         self.http_accessible_channels = set()
         self.websocket_accessible_channels = set()
         self.running = False
-        
+
+        # Общая очередь исходящих сообщений (устанавливается приложением)
+        self.outbound_queue = None
+
+        # Одна долгоживущая aiohttp-сессия на сервис: keep-alive вместо
+        # TCP+TLS рукопожатия на каждый запрос и каждое подключение
+        self._http_session = None
+
+        # Кэш URL Gateway: меняется крайне редко, запрашивать его на
+        # каждом реконнекте незачем
+        self._gateway_url = None
+        self._gateway_url_ts = 0.0
+
+        # Колбэк приложения при изменении SERVER_CHANNEL_MAPPINGS
+        self.on_mappings_changed = None
+
+        # Dirty-флаг message_mappings: вместо полной JSON-перезаписи на
+        # каждое пересланное сообщение - периодический фоновый сброс
+        self._mapping_dirty = False
+
+        # LRU-дедупликация MESSAGE_CREATE: каждый токен в одном guild-е
+        # получает свой экземпляр события, пересылать нужно один
+        self._seen_ids = OrderedDict()
+        self._seen_max = 4096
+
+        # Индекс channel_id -> (server, name): O(1) на MESSAGE_CREATE
+        # вместо прохода по всем серверам конфига
+        self._channel_index = {}
+        self._rebuild_channel_index()
+
         # Новые атрибуты для автообнаружения
         self.last_server_scan = 0
         self.server_scan_interval = 300  # 5 минут
         self.known_servers = set()
         self.auto_discovery_enabled = True
         self.discovery_lock = threading.Lock()
-        
+
         # Инициализируем WebSocket сессии для каждого токена
         for token in config.DISCORD_TOKENS:
             ws_session = {
                 'token': token,
                 'websocket': None,
-                'session': None,
                 'heartbeat_task': None,
                 'user_id': None,
                 'connected_guilds': set(),
-                'last_guild_sync': 0
+                'last_guild_sync': 0,
+                # Состояние RESUME своего подключения: у каждого токена
+                # своя Gateway-сессия, общий session_id их перемешивал бы
+                'session_id': None,
+                'last_sequence': None,
+                'resume_gateway_url': None
             }
             self.websockets.append(ws_session)
-    
+
+    def _refresh_subscription_snapshot(self):
+        """Атомарная подмена frozenset-снимка подписок после записи"""
+        self.subscribed_channels = frozenset(self._subscribed_set)
+
+    def _rebuild_channel_index(self):
+        """Пересборка индекса каналов из SERVER_CHANNEL_MAPPINGS"""
+        self._channel_index = {
+            channel_id: (server, channel_name)
+            for server, channels in config.SERVER_CHANNEL_MAPPINGS.items()
+            for channel_id, channel_name in channels.items()
+        }
+
+    async def _ensure_http_session(self):
+        """Ленивое создание общей aiohttp-сессии (пересоздается после stop)"""
+        if self._http_session is None or self._http_session.closed:
+            self._http_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=100,
+                    limit_per_host=30,
+                    ttl_dns_cache=300
+                ),
+                # Крупный буфер чтения - меньше recv() на больших кадрах
+                read_bufsize=2 ** 18
+            )
+        return self._http_session
+
     async def identify(self, websocket, token):
         """Send IDENTIFY payload с расширенными intents"""
         identify_payload = {
@@ -53,59 +129,107 @@ class DiscordWebSocketService:
                 },
                 "compress": False,
                 "large_threshold": 50,
+                # Без member/presence списков: user-токены игнорируют intents,
+                # и именно этот флаг избавляет от потока PRESENCE_UPDATE
+                "guild_subscriptions": False,
+                # GUILDS (1) нужен автообнаружению (GUILD_CREATE/DELETE)
                 "intents": 33281  # GUILDS (1) + GUILD_MESSAGES (512) + MESSAGE_CONTENT (32768)
             }
         }
-        await websocket.send_str(json.dumps(identify_payload))
+        await websocket.send_str(json_dumps(identify_payload))
         logger.info(f"🔑 Sent IDENTIFY with enhanced intents for auto-discovery")
-    
-    async def send_heartbeat(self, websocket, interval):
-        """Send periodic heartbeat to maintain connection"""
+
+    async def resume(self, ws_session):
+        """Send RESUME payload - возобновляем сессию вместо новой IDENTIFY
+
+        Gateway доставит все события, пропущенные после last_sequence,
+        поэтому окно реконнекта не теряет сообщений.
+        """
+        resume_payload = {
+            "op": 6,
+            "d": {
+                "token": ws_session['token'],
+                "session_id": ws_session['session_id'],
+                "seq": ws_session['last_sequence']
+            }
+        }
+        await ws_session['websocket'].send_str(json_dumps(resume_payload))
+        logger.info(f"🔄 Sent RESUME for session {ws_session['session_id']} (seq: {ws_session['last_sequence']})")
+
+    async def send_heartbeat(self, ws_session):
+        """Постоянный heartbeat-цикл одной ws-сессии
+
+        Задача живет дольше отдельных подключений: интервал и websocket
+        перечитываются на каждом тике, поэтому HELLO лишь обновляет
+        heartbeat_interval вместо cancel/create - меньше отмененных задач
+        в планировщике на нестабильных соединениях.
+        """
         try:
             while self.running:
-                heartbeat_payload = {
-                    "op": 1,
-                    "d": self.last_sequence
-                }
-                await websocket.send_str(json.dumps(heartbeat_payload))
-                logger.debug("💓 Sent heartbeat")
-                await asyncio.sleep(interval / 1000)
+                await asyncio.sleep(self.heartbeat_interval / 1000)
+
+                websocket = ws_session['websocket']
+                if websocket is None or websocket.closed:
+                    continue
+
+                # Форма payload-а тривиальна - собираем строку без
+                # сериализатора и словаря на каждый такт
+                seq = ws_session['last_sequence']
+                heartbeat_payload = f'{{"op":1,"d":{"null" if seq is None else seq}}}'
+                try:
+                    await websocket.send_str(heartbeat_payload)
+                    logger.debug("💓 Sent heartbeat")
+                except Exception as e:
+                    logger.debug("💔 Heartbeat send failed: {}", e)
         except asyncio.CancelledError:
             logger.info("Heartbeat task cancelled")
-        except Exception as e:
-            logger.error(f"Error in heartbeat: {e}")
+
+    async def _periodic_mapping_save(self):
+        """Фоновый сброс message_mappings на диск по dirty-флагу"""
+        loop = asyncio.get_event_loop()
+        while self.running:
+            await asyncio.sleep(5)
+            if self._mapping_dirty and self.telegram_bot:
+                self._mapping_dirty = False
+                try:
+                    await loop.run_in_executor(None, self.telegram_bot._save_data)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка фонового сохранения маппингов: {e}")
 
     async def periodic_server_discovery(self):
         """Периодическое обнаружение новых серверов"""
+        # Якорим расписание на monotonic, чтобы длительность сканирования
+        # не дрейфовала в интервал
+        next_wakeup = time.monotonic() + self.server_scan_interval
+
         while self.running:
             try:
-                await asyncio.sleep(self.server_scan_interval)
-                
+                await asyncio.sleep(max(0, next_wakeup - time.monotonic()))
+                next_wakeup += self.server_scan_interval
+
                 if not self.auto_discovery_enabled:
                     continue
-                
+
                 current_time = time.time()
                 if current_time - self.last_server_scan > self.server_scan_interval:
                     logger.info("🔍 Запуск периодического сканирования новых серверов...")
                     await self.discover_and_add_new_servers()
                     self.last_server_scan = current_time
-                    
+
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"❌ Ошибка в периодическом сканировании: {e}")
                 await asyncio.sleep(60)
+                next_wakeup = time.monotonic() + self.server_scan_interval
 
     async def discover_and_add_new_servers(self):
         """Обнаруживаем новые серверы и добавляем их в конфиг"""
         try:
-            # Импортируем обнаружитель
-            from discord_telegram_parser.utils.channel_id_parser import discover_new_servers_only
-            
             # Выполняем в отдельном потоке
             loop = asyncio.get_event_loop()
             new_servers = await loop.run_in_executor(None, discover_new_servers_only)
-            
+
             if new_servers:
                 with self.discovery_lock:
                     # Добавляем новые серверы в конфиг
@@ -113,106 +237,201 @@ class DiscordWebSocketService:
                         if server_name not in config.SERVER_CHANNEL_MAPPINGS:
                             config.SERVER_CHANNEL_MAPPINGS[server_name] = channels
                             self.known_servers.add(server_name)
-                            
+
                             # ИСПРАВЛЕНИЕ: Добавляем каналы в подписки
-                            for channel_id in channels.keys():
-                                self.subscribed_channels.add(channel_id)
+                            for channel_id, channel_name in channels.items():
+                                self._subscribed_set.add(channel_id)
+                                self._channel_index[channel_id] = (server_name, channel_name)
                                 logger.info(f"📡 Канал добавлен в подписку: {channel_id}")
-                            
+
                             logger.success(f"🆕 Автоматически добавлен сервер: {server_name} ({len(channels)} каналов)")
-                
+
+                    self._refresh_subscription_snapshot()
+
                 # Создаем топики в Telegram для новых серверов
                 if self.telegram_bot:
                     for server_name in new_servers.keys():
                         try:
                             topic_id = await loop.run_in_executor(
-                        None,
-                        self.telegram_bot._get_or_create_topic_safe,
-                        message.server_name
-                    )
-                    
-                    if topic_id is None:
-                        logger.error(f"❌ Failed to get/create topic for {message.server_name}")
-                        return
-                else:
-                    logger.error("❌ Cannot create topic - chat doesn't support topics")
-                    return
-            else:
-                logger.info(f"✅ Using existing topic {topic_id} for {message.server_name}")
-            
-            # Форматируем и отправляем сообщение
-            formatted = self.telegram_bot.format_message(message)
-            sent_msg = await loop.run_in_executor(
-                None,
-                self.telegram_bot._send_message,
-                formatted,
-                None,
-                topic_id,
-                message.server_name
-            )
-            
-            if sent_msg:
-                self.telegram_bot.message_mappings[str(message.timestamp)] = sent_msg.message_id
-                self.telegram_bot._save_data()
-                
-                topic_info = f" to topic {topic_id}" if topic_id else " as regular message"
-                logger.success(f"✅ Successfully forwarded{topic_info}")
+                                None,
+                                self.telegram_bot._get_or_create_topic_safe,
+                                server_name
+                            )
+                            if topic_id:
+                                logger.success(f"📋 Создан топик для нового сервера {server_name}: {topic_id}")
+                        except Exception as e:
+                            logger.error(f"❌ Ошибка создания топика для {server_name}: {e}")
+
+                # Сохраняем обновленный конфиг
+                self._save_updated_config()
+
+                logger.success(f"🎉 Автообнаружение завершено: добавлено {len(new_servers)} новых серверов")
             else:
-                logger.error("❌ Failed to send to Telegram")
-            
+                logger.debug("ℹ️ Новых серверов не обнаружено")
+
         except Exception as e:
-            logger.error(f"❌ Error forwarding to Telegram: {e}")
+            logger.error(f"❌ Ошибка автообнаружения серверов: {e}")
+
+    def _save_updated_config(self):
+        """Сохраняем обновленный конфиг в файл"""
+        # Маппинги изменились - приводим индекс каналов в соответствие
+        self._rebuild_channel_index()
+
+        # Даем приложению обновить производные структуры
+        if self.on_mappings_changed is not None:
+            try:
+                self.on_mappings_changed()
+            except Exception as e:
+                logger.error(f"❌ Ошибка колбэка изменения маппингов: {e}")
+
+        try:
+            # Пишем во временный файл и атомарно подменяем
+            tmp_file = CHANNEL_MAPPINGS_FILE + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write(dumps_indented(config.SERVER_CHANNEL_MAPPINGS))
+            os.replace(tmp_file, CHANNEL_MAPPINGS_FILE)
+
+            logger.info("💾 Конфигурация обновлена и сохранена")
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения конфига: {e}")
+
+    def _enqueue_gateway_event(self, queue, data):
+        """Постановка события в очередь обработки с drop-oldest при переполнении"""
+        if queue.full():
+            try:
+                queue.get_nowait()
+                logger.warning("⚠️ Очередь Gateway переполнена - отброшено старейшее событие")
+            except asyncio.QueueEmpty:
+                pass
+        queue.put_nowait(data)
+
+    async def _dispatch_loop(self, queue, ws_session):
+        """Обработка событий Gateway отдельно от чтения сокета"""
+        try:
+            while True:
+                data = await queue.get()
+                await self.handle_gateway_message(data, ws_session)
+        except asyncio.CancelledError:
+            pass
 
     async def connect_websocket(self, ws_session):
-        """Подключение к Discord Gateway WebSocket"""
+        """Подключение к Discord Gateway WebSocket
+
+        Чтение сокета и обработка событий разделены ограниченной
+        очередью: зависший обработчик (Telegram, запись на диск) не
+        останавливает чтение, и Gateway не закрывает сессию по таймауту.
+        """
+        dispatch_worker = None
         try:
-            # Получаем URL Gateway
-            async with aiohttp.ClientSession() as session:
-                async with session.get('https://discord.com/api/v9/gateway') as resp:
-                    gateway_data = await resp.json()
-                    gateway_url = gateway_data['url']
-            
-            # Подключаемся к WebSocket
-            ws_session['session'] = aiohttp.ClientSession()
-            ws_session['websocket'] = await ws_session['session'].ws_connect(
-                f"{gateway_url}/?v=9&encoding=json"
+            # При возобновлении сессии подключаемся к resume_gateway_url,
+            # иначе запрашиваем обычный URL Gateway
+            http = await self._ensure_http_session()
+            if ws_session['session_id'] and ws_session['resume_gateway_url']:
+                gateway_url = ws_session['resume_gateway_url']
+            else:
+                if (self._gateway_url is None
+                        or time.monotonic() - self._gateway_url_ts > 3600):
+                    async with http.get('https://discord.com/api/v9/gateway') as resp:
+                        gateway_data = await resp.json()
+                    self._gateway_url = gateway_data['url']
+                    self._gateway_url_ts = time.monotonic()
+                gateway_url = self._gateway_url
+
+            # Подключаемся к WebSocket через общую сессию. Транспортное
+            # сжатие zlib-stream кратно режет байты на READY/GUILD_CREATE
+            # max_msg_size=0 снимает 4MB-потолок aiohttp: READY больших
+            # аккаунтов его превышает. permessage-deflate не включаем -
+            # поток уже сжат zlib-stream на уровне Gateway
+            ws_session['websocket'] = await http.ws_connect(
+                f"{gateway_url}/?v=9&encoding=json&compress=zlib-stream",
+                max_msg_size=0,
+                timeout=30
             )
-            
+
             logger.info(f"🔗 Connected to Discord Gateway: {gateway_url}")
-            
+
+            # Потоковый инфлятор живет все подключение; полное сообщение
+            # заканчивается Z_SYNC_FLUSH маркером 00 00 ff ff
+            inflator = zlib.decompressobj()
+            buffer = bytearray()
+
+            dispatch_queue = asyncio.Queue(maxsize=1000)
+            dispatch_worker = asyncio.create_task(
+                self._dispatch_loop(dispatch_queue, ws_session)
+            )
+
             # Слушаем сообщения
             async for msg in ws_session['websocket']:
-                if msg.type == aiohttp.WSMsgType.TEXT:
-                    data = json.loads(msg.data)
-                    await self.handle_gateway_message(data, ws_session)
+                if msg.type == aiohttp.WSMsgType.BINARY:
+                    buffer.extend(msg.data)
+                    if len(buffer) < 4 or buffer[-4:] != b'\x00\x00\xff\xff':
+                        continue
+                    decoded = inflator.decompress(bytes(buffer))
+                    buffer.clear()
+                    self._enqueue_gateway_event(dispatch_queue, json_loads(decoded))
+                elif msg.type == aiohttp.WSMsgType.TEXT:
+                    # Несжатый fallback: каждый кадр разбирается orjson-ом
+                    self._enqueue_gateway_event(dispatch_queue, json_loads(msg.data))
                 elif msg.type == aiohttp.WSMsgType.ERROR:
                     logger.error(f"WebSocket error: {ws_session['websocket'].exception()}")
                     break
                 elif msg.type == aiohttp.WSMsgType.CLOSE:
                     logger.warning("WebSocket connection closed")
                     break
-                    
+
         except Exception as e:
             logger.error(f"WebSocket connection error: {e}")
         finally:
+            if dispatch_worker is not None:
+                dispatch_worker.cancel()
+                try:
+                    await dispatch_worker
+                except asyncio.CancelledError:
+                    pass
             await self.cleanup_websocket(ws_session)
 
+    async def _connection_loop(self, ws_session):
+        """Переподключение одной ws-сессии, пока сервис работает
+
+        connect_websocket возвращается при любом разрыве сокета; без
+        повторного вызова сохраненные session_id/resume_gateway_url
+        никогда бы не использовались, а op 7 RECONNECT навсегда глушил
+        бы токен вместо возобновления сессии.
+
+        Повторное подключение - с экспоненциальным backoff и jitter:
+        фиксированная пауза при длительном сбое Discord жгла бы бюджет
+        реконнектов и синхронизировала "штормы" повторов между сессиями.
+        """
+        base_backoff = 2.0
+        max_backoff = 300.0
+        attempt = 0
+
+        while self.running:
+            started_at = time.monotonic()
+            await self.connect_websocket(ws_session)
+            if not self.running:
+                break
+
+            # Сессия прожила заметное время - сбрасываем серию неудач
+            if time.monotonic() - started_at > 60:
+                attempt = 0
+
+            delay = min(max_backoff, base_backoff * 2 ** attempt) * (0.5 + random.random() / 2)
+            attempt += 1
+            logger.info(f"🔄 Reconnecting gateway in {delay:.1f}s (attempt {attempt})...")
+            await asyncio.sleep(delay)
+
     async def cleanup_websocket(self, ws_session):
-        """Очистка WebSocket соединения"""
+        """Очистка WebSocket соединения
+
+        Heartbeat-задачу не трогаем: она переживает реконнекты и
+        останавливается в stop().
+        """
         try:
-            if ws_session['heartbeat_task']:
-                ws_session['heartbeat_task'].cancel()
-                try:
-                    await ws_session['heartbeat_task']
-                except asyncio.CancelledError:
-                    pass
-            
             if ws_session['websocket'] and not ws_session['websocket'].closed:
                 await ws_session['websocket'].close()
-            
-            if ws_session['session'] and not ws_session['session'].closed:
-                await ws_session['session'].close()
-                
+
         except Exception as e:
             logger.error(f"Error cleaning up WebSocket: {e}")
 
@@ -220,21 +439,24 @@ class DiscordWebSocketService:
         """Запуск WebSocket сервиса с автообнаружением"""
         self.running = True
         logger.info("🚀 Starting Enhanced Discord WebSocket service with auto-discovery...")
-        
+
+        await self._ensure_http_session()
+
         # Инициализируем известные серверы
         self.known_servers = set(config.SERVER_CHANNEL_MAPPINGS.keys())
-        
-        # Запускаем периодическое обнаружение
+
+        # Запускаем периодическое обнаружение и фоновый сброс маппингов
         discovery_task = asyncio.create_task(self.periodic_server_discovery())
-        
+        mapping_save_task = asyncio.create_task(self._periodic_mapping_save())
+
         # Запускаем WebSocket подключения
         websocket_tasks = []
         for ws_session in self.websockets:
-            task = asyncio.create_task(self.connect_websocket(ws_session))
+            task = asyncio.create_task(self._connection_loop(ws_session))
             websocket_tasks.append(task)
-        
+
         try:
-            await asyncio.gather(discovery_task, *websocket_tasks)
+            await asyncio.gather(discovery_task, mapping_save_task, *websocket_tasks)
         except Exception as e:
             logger.error(f"Error in WebSocket service: {e}")
         finally:
@@ -244,20 +466,38 @@ class DiscordWebSocketService:
         """Остановка WebSocket сервиса"""
         self.running = False
         logger.info("Stopping Enhanced Discord WebSocket service...")
-        
+
         for ws_session in self.websockets:
+            if ws_session['heartbeat_task']:
+                ws_session['heartbeat_task'].cancel()
+                try:
+                    await ws_session['heartbeat_task']
+                except asyncio.CancelledError:
+                    pass
+                ws_session['heartbeat_task'] = None
             await self.cleanup_websocket(ws_session)
 
+        if self._http_session is not None and not self._http_session.closed:
+            await self._http_session.close()
+
+        # Финальный сброс несохраненных маппингов
+        if self._mapping_dirty and self.telegram_bot:
+            self._mapping_dirty = False
+            await asyncio.get_event_loop().run_in_executor(None, self.telegram_bot._save_data)
+
     def add_channel_subscription(self, channel_id):
         """Добавление канала в подписки"""
-        self.subscribed_channels.add(channel_id)
+        self._subscribed_set.add(channel_id)
+        self._refresh_subscription_snapshot()
         logger.info(f"Added channel {channel_id} to subscriptions")
 
     def remove_channel_subscription(self, channel_id):
         """Удаление канала из подписок"""
-        self.subscribed_channels.discard(channel_id)
+        self._subscribed_set.discard(channel_id)
+        self._refresh_subscription_snapshot()
         self.http_accessible_channels.discard(channel_id)
         self.websocket_accessible_channels.discard(channel_id)
+        self._channel_index.pop(channel_id, None)
         logger.info(f"Removed channel {channel_id} from subscriptions")
 
     def enable_auto_discovery(self):
@@ -278,50 +518,7 @@ class DiscordWebSocketService:
             'subscribed_channels': len(self.subscribed_channels),
             'last_server_scan': self.last_server_scan,
             'scan_interval': self.server_scan_interval
-        }d = await loop.run_in_executor(
-                                None,
-                                self.telegram_bot._get_or_create_topic_safe,
-                                server_name
-                            )
-                            if topic_id:
-                                logger.success(f"📋 Создан топик для нового сервера {server_name}: {topic_id}")
-                        except Exception as e:
-                            logger.error(f"❌ Ошибка создания топика для {server_name}: {e}")
-                
-                # Сохраняем обновленный конфиг
-                self._save_updated_config()
-                
-                logger.success(f"🎉 Автообнаружение завершено: добавлено {len(new_servers)} новых серверов")
-            else:
-                logger.debug("ℹ️ Новых серверов не обнаружено")
-                
-        except Exception as e:
-            logger.error(f"❌ Ошибка автообнаружения серверов: {e}")
-
-    def _save_updated_config(self):
-        """Сохраняем обновленный конфиг в файл"""
-        try:
-            config_file_path = 'discord_telegram_parser/config/settings.py'
-            
-            # Читаем текущий файл
-            with open(config_file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Создаем новую секцию конфигурации
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            new_mappings = f"\n\n# Auto-updated server mappings - {timestamp}\nconfig.SERVER_CHANNEL_MAPPINGS = {json.dumps(config.SERVER_CHANNEL_MAPPINGS, indent=2, ensure_ascii=False)}\n"
-            
-            # Добавляем в конец файла
-            content += new_mappings
-            
-            # Записываем обратно
-            with open(config_file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-                
-            logger.info("💾 Конфигурация обновлена и сохранена")
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка сохранения конфига: {e}")
+        }
 
     async def handle_gateway_message(self, data, ws_session):
         """Обработка сообщений от Discord Gateway с поддержкой автообнаружения"""
@@ -329,54 +526,87 @@ class DiscordWebSocketService:
             if data['op'] == 10:  # HELLO
                 self.heartbeat_interval = data['d']['heartbeat_interval']
                 logger.info(f"👋 Received HELLO, heartbeat interval: {self.heartbeat_interval}ms")
-                
-                # Start heartbeat
-                ws_session['heartbeat_task'] = asyncio.create_task(
-                    self.send_heartbeat(ws_session['websocket'], self.heartbeat_interval)
-                )
-                
-                # Send IDENTIFY
-                await self.identify(ws_session['websocket'], ws_session['token'])
-                
+
+                # Долгоживущей heartbeat-задаче достаточно нового интервала;
+                # создаем ее только при первом HELLO или после остановки
+                if ws_session['heartbeat_task'] is None or ws_session['heartbeat_task'].done():
+                    ws_session['heartbeat_task'] = asyncio.create_task(
+                        self.send_heartbeat(ws_session)
+                    )
+
+                # Если есть живая сессия - возобновляем ее, иначе новая IDENTIFY
+                if ws_session['session_id'] and ws_session['last_sequence'] is not None:
+                    await self.resume(ws_session)
+                else:
+                    await self.identify(ws_session['websocket'], ws_session['token'])
+
             elif data['op'] == 11:  # HEARTBEAT_ACK
                 logger.debug("💚 Received heartbeat ACK")
-                
+
+            elif data['op'] == 7:  # RECONNECT
+                # Gateway просит переподключиться - закрываем сокет,
+                # сессию сохраняем для RESUME при следующем подключении
+                logger.warning("🔄 Gateway requested RECONNECT - closing for resume...")
+                await ws_session['websocket'].close()
+
+            elif data['op'] == 9:  # INVALID_SESSION
+                resumable = bool(data.get('d'))
+                if not resumable:
+                    logger.warning("⚠️ Session invalidated - starting fresh IDENTIFY")
+                    ws_session['session_id'] = None
+                    ws_session['last_sequence'] = None
+                    ws_session['resume_gateway_url'] = None
+                # Discord требует паузу 1-5 секунд перед повторной аутентификацией
+                await asyncio.sleep(2)
+                if ws_session['session_id'] and ws_session['last_sequence'] is not None:
+                    await self.resume(ws_session)
+                else:
+                    await self.identify(ws_session['websocket'], ws_session['token'])
+
             elif data['op'] == 0:  # DISPATCH
-                self.last_sequence = data['s']
+                ws_session['last_sequence'] = data['s']
                 event_type = data['t']
-                
+
+                # Шумовые события отбрасываем до какой-либо обработки
+                if event_type in ('PRESENCE_UPDATE', 'TYPING_START', 'GUILD_MEMBER_UPDATE'):
+                    return
+
                 if event_type == 'READY':
                     await self._handle_ready_event(data['d'], ws_session)
-                    
+
+                elif event_type == 'RESUMED':
+                    logger.success(f"✅ Session resumed - missed events replayed (seq: {ws_session['last_sequence']})")
+
                 elif event_type == 'MESSAGE_CREATE':
                     await self.handle_new_message(data['d'])
-                    
+
                 elif event_type == 'GUILD_CREATE':
                     await self._handle_guild_create_event(data['d'], ws_session)
-                    
+
                 elif event_type == 'GUILD_DELETE':
                     await self._handle_guild_delete_event(data['d'], ws_session)
-                    
+
         except Exception as e:
             logger.error(f"Error handling gateway message: {e}")
 
     async def _handle_ready_event(self, ready_data, ws_session):
         """Обработка READY события"""
-        self.session_id = ready_data['session_id']
+        ws_session['session_id'] = ready_data['session_id']
+        ws_session['resume_gateway_url'] = ready_data.get('resume_gateway_url')
         ws_session['user_id'] = ready_data['user']['id']
         user = ready_data['user']
         guilds = ready_data['guilds']
-        
+
         logger.success(f"🚀 WebSocket ready for user: {user['username']}")
         logger.info(f"🏰 Connected to {len(guilds)} guilds")
-        
+
         # Сохраняем подключенные серверы
         ws_session['connected_guilds'] = {g['id'] for g in guilds}
-        
+
         # Инициализируем известные серверы
         if not self.known_servers:
             self.known_servers = set(config.SERVER_CHANNEL_MAPPINGS.keys())
-        
+
         # Выполняем гибридную верификацию каналов
         await self.hybrid_channel_verification(ws_session, guilds)
 
@@ -384,14 +614,14 @@ class DiscordWebSocketService:
         """Обработка GUILD_CREATE - новый сервер присоединился"""
         guild_id = guild_data['id']
         guild_name = guild_data['name']
-        
+
         # Проверяем, является ли это действительно новым сервером
         if guild_id not in ws_session['connected_guilds']:
             logger.info(f"🆕 НОВЫЙ СЕРВЕР ОБНАРУЖЕН: {guild_name} (ID: {guild_id})")
-            
+
             # Добавляем в подключенные серверы
             ws_session['connected_guilds'].add(guild_id)
-            
+
             # Если автообнаружение включено, обрабатываем новый сервер
             if self.auto_discovery_enabled and guild_name not in self.known_servers:
                 await self._process_new_guild_real_time(guild_data, ws_session)
@@ -403,7 +633,7 @@ class DiscordWebSocketService:
         """Обработка GUILD_DELETE - сервер покинут или недоступен"""
         guild_id = guild_data['id']
         unavailable = guild_data.get('unavailable', False)
-        
+
         if unavailable:
             logger.warning(f"⚠️ Сервер {guild_id} временно недоступен")
         else:
@@ -414,13 +644,13 @@ class DiscordWebSocketService:
         """Обработка нового сервера в реальном времени с ПОЛНОЙ синхронизацией"""
         guild_name = guild_data['name']
         guild_id = guild_data['id']
-        
+
         logger.info(f"🔍 Обрабатываем новый сервер в реальном времени: {guild_name}")
-        
+
         try:
             # Получаем announcement каналы
             announcement_channels = await self._extract_announcement_channels_from_guild(guild_data)
-            
+
             if announcement_channels:
                 with self.discovery_lock:
                     # Добавляем в конфиг
@@ -428,14 +658,16 @@ class DiscordWebSocketService:
                     for channel_id, channel_info in announcement_channels.items():
                         config.SERVER_CHANNEL_MAPPINGS[guild_name][channel_id] = channel_info['name']
                         # ВАЖНО: Добавляем в подписки WebSocket
-                        self.subscribed_channels.add(channel_id)
+                        self._subscribed_set.add(channel_id)
                         self.websocket_accessible_channels.add(channel_id)
+                        self._channel_index[channel_id] = (guild_name, channel_info['name'])
                         logger.info(f"  📡 Добавлен в WebSocket подписку: {channel_info['name']} ({channel_id})")
-                    
+
                     self.known_servers.add(guild_name)
-                
+                    self._refresh_subscription_snapshot()
+
                 logger.success(f"✅ Автоматически добавлен новый сервер: {guild_name} ({len(announcement_channels)} каналов)")
-                
+
                 # Создаем топик в Telegram
                 if self.telegram_bot:
                     try:
@@ -449,68 +681,78 @@ class DiscordWebSocketService:
                             logger.success(f"📋 Создан топик для нового сервера {guild_name}: {topic_id}")
                     except Exception as e:
                         logger.error(f"❌ Ошибка создания топика для {guild_name}: {e}")
-                
+
                 # НОВОЕ: Выполняем начальную синхронизацию сообщений
                 await self._sync_new_server_messages(guild_name, announcement_channels, ws_session)
-                
+
                 # Сохраняем конфиг
                 self._save_updated_config()
-                
+
                 # Отправляем уведомление в Telegram
                 if self.telegram_bot:
                     await self._send_new_server_notification(guild_name, len(announcement_channels))
             else:
                 logger.info(f"ℹ️ В новом сервере {guild_name} не найдены announcement каналы")
-                
+
         except Exception as e:
             logger.error(f"❌ Ошибка обработки нового сервера {guild_name}: {e}")
 
     async def _sync_new_server_messages(self, server_name, announcement_channels, ws_session):
         """Синхронизация сообщений из новых каналов"""
         logger.info(f"📥 Синхронизация сообщений для нового сервера: {server_name}")
-        
+
         try:
-            # Импортируем парсер для HTTP запросов
-            from discord_telegram_parser.main import DiscordParser
-            
             # Создаем временный парсер
             parser = DiscordParser()
             all_messages = []
-            
-            for channel_id, channel_info in announcement_channels.items():
+
+            # Каналы выбираем параллельно через executor: блокирующие HTTP
+            # вызовы не держат event loop и не выполняются последовательно
+            loop = asyncio.get_event_loop()
+            channel_items = list(announcement_channels.items())
+            fetch_tasks = [
+                loop.run_in_executor(
+                    None,
+                    parser.parse_announcement_channel,
+                    channel_id,
+                    server_name,
+                    channel_info['name'],
+                    5
+                )
+                for channel_id, channel_info in channel_items
+            ]
+            results = await asyncio.gather(*fetch_tasks, return_exceptions=True)
+
+            # Имя сервера одно на весь вызов - санитизируем единожды
+            safe_server = self.safe_encode_string(server_name)
+
+            for (channel_id, channel_info), result in zip(channel_items, results):
                 channel_name = channel_info['name']
-                
-                try:
-                    # Получаем последние 5 сообщений из канала
-                    messages = parser.parse_announcement_channel(
-                        channel_id, 
-                        server_name,
-                        channel_name,
-                        limit=5
-                    )
-                    
-                    if messages:
-                        # Очищаем содержимое от проблем с кодировкой
-                        for msg in messages:
-                            msg.content = self.safe_encode_string(msg.content)
-                            msg.author = self.safe_encode_string(msg.author)
-                            msg.server_name = self.safe_encode_string(msg.server_name)
-                            msg.channel_name = self.safe_encode_string(msg.channel_name)
-                        
-                        all_messages.extend(messages)
-                        logger.success(f"  📥 {channel_name}: получено {len(messages)} сообщений")
-                    else:
-                        logger.info(f"  ℹ️ {channel_name}: сообщения не найдены")
-                        
-                except Exception as e:
-                    logger.warning(f"  ❌ Ошибка синхронизации {channel_name}: {e}")
+
+                if isinstance(result, BaseException):
+                    logger.warning(f"  ❌ Ошибка синхронизации {channel_name}: {result}")
                     continue
-            
+
+                if result:
+                    # Очищаем содержимое от проблем с кодировкой; имена
+                    # каналов/сервера санитизируем по разу, не на сообщение
+                    safe_channel = self.safe_encode_string(channel_name)
+                    for msg in result:
+                        msg.content = self.safe_encode_string(msg.content)
+                        msg.author = self.safe_encode_string(msg.author)
+                        msg.server_name = safe_server
+                        msg.channel_name = safe_channel
+
+                    all_messages.extend(result)
+                    logger.success(f"  📥 {channel_name}: получено {len(result)} сообщений")
+                else:
+                    logger.info(f"  ℹ️ {channel_name}: сообщения не найдены")
+
             # Отправляем сообщения в Telegram если есть
             if all_messages:
                 # Сортируем по времени (старые сначала)
-                all_messages.sort(key=lambda x: x.timestamp)
-                
+                all_messages.sort(key=attrgetter('epoch'))
+
                 # Отправляем через Telegram бота
                 if self.telegram_bot:
                     loop = asyncio.get_event_loop()
@@ -519,13 +761,13 @@ class DiscordWebSocketService:
                         self.telegram_bot.send_messages,
                         all_messages
                     )
-                    
+
                     logger.success(f"✅ Отправлено {len(all_messages)} сообщений для {server_name}")
                 else:
                     logger.warning("❌ Telegram bot недоступен для отправки сообщений")
             else:
                 logger.info(f"ℹ️ Нет сообщений для синхронизации в {server_name}")
-                
+
         except Exception as e:
             logger.error(f"❌ Ошибка синхронизации сообщений для {server_name}: {e}")
 
@@ -535,8 +777,14 @@ class DiscordWebSocketService:
             return ""
         try:
             if isinstance(text, str):
+                # ASCII-строки заведомо чистые - пропускаем encode/decode
+                if text.isascii():
+                    return text
                 text = text.encode('utf-8', 'surrogatepass').decode('utf-8', 'replace')
-                text = ''.join(char for char in text if ord(char) < 0x110000)
+                text = text.translate(_SURROGATE_TABLE)
+                # NFC Quick-Check: уже нормализованные строки не трогаем
+                if not unicodedata.is_normalized('NFC', text):
+                    text = unicodedata.normalize('NFC', text)
             return text
         except (UnicodeEncodeError, UnicodeDecodeError):
             return "[Encoding Error]"
@@ -545,32 +793,34 @@ class DiscordWebSocketService:
         """Извлекаем announcement каналы из данных сервера"""
         channels = guild_data.get('channels', [])
         announcement_channels = {}
-        
+
         # Приоритетные keywords для поиска
         priority_keywords = [
             'announcements',     # Высший приоритет
-            'announcement', 
+            'announcement',
             'news',
             'updates',
             'важное',
             'объявления'
         ]
-        
+
         for channel in channels:
             if channel['type'] not in [0, 5]:  # Только текстовые и announcement каналы
                 continue
-                
-            channel_name = channel['name'].lower()
-            
-            # 1. Официальный announcement тип (приоритет 1)
-            if channel.get('type') == 5:
+
+            # 1. Официальный announcement тип (приоритет 1) - решается
+            # по типу, без строковых операций
+            if channel['type'] == 5:
                 announcement_channels[channel['id']] = {
                     'name': channel['name'],
                     'type': channel['type'],
                     'priority': 1
                 }
                 continue
-            
+
+            # Нижний регистр считаем один раз на канал
+            channel_name = channel['name'].lower()
+
             # 2. Точное совпадение "announcements" (приоритет 2)
             if channel_name == 'announcements':
                 announcement_channels[channel['id']] = {
@@ -579,7 +829,7 @@ class DiscordWebSocketService:
                     'priority': 2
                 }
                 continue
-            
+
             # 3. Содержит приоритетные keywords (приоритет 3-10)
             for i, keyword in enumerate(priority_keywords):
                 if keyword in channel_name:
@@ -589,13 +839,13 @@ class DiscordWebSocketService:
                         'priority': 3 + i
                     }
                     break
-        
+
         # Возвращаем топ-3 канала по приоритету
         sorted_channels = dict(sorted(
             announcement_channels.items(),
             key=lambda x: x[1]['priority']
         )[:3])
-        
+
         return sorted_channels
 
     async def _send_new_server_notification(self, server_name, channels_count):
@@ -610,7 +860,7 @@ class DiscordWebSocketService:
                 f"📥 Последние сообщения синхронизированы\n\n"
                 f"Мониторинг уже активен! 🚀"
             )
-            
+
             loop = asyncio.get_event_loop()
             await loop.run_in_executor(
                 None,
@@ -620,22 +870,20 @@ class DiscordWebSocketService:
                 None,  # message_thread_id
                 None   # server_name
             )
-            
+
         except Exception as e:
             logger.error(f"❌ Ошибка отправки уведомления о новом сервере: {e}")
 
     async def test_http_access(self, channel_id, server_name, channel_name, token):
         """Test HTTP API access"""
         try:
-            async with aiohttp.ClientSession() as session:
-                headers = {'Authorization': token}
-                
-                async with session.get(
-                    f'https://discord.com/api/v9/channels/{channel_id}/messages?limit=1',
-                    headers=headers
-                ) as resp:
-                    return resp.status == 200
-                        
+            http = await self._ensure_http_session()
+            async with http.get(
+                f'https://discord.com/api/v9/channels/{channel_id}/messages?limit=1',
+                headers={'Authorization': token}
+            ) as resp:
+                return resp.status == 200
+
         except Exception:
             return False
 
@@ -645,61 +893,70 @@ class DiscordWebSocketService:
             channels = guild.get('channels', [])
             for channel in channels:
                 if channel['id'] == channel_id:
-                    # Проверяем в порядке приоритета
-                    if channel['type'] == 0 and channel['name'].lower() == 'announcements':
-                        return True
+                    # Сначала проверка по типу, затем один .lower():
+                    # 'announcement' покрывает и точное 'announcements'
                     if channel.get('type') == 5:
                         return True
-                    if (channel['type'] == 0 and 
-                        any(keyword in channel['name'].lower() 
-                            for keyword in ['announcements', 'announcement'])):
+                    if channel['type'] == 0 and 'announcement' in channel['name'].lower():
                         return True
         return False
 
     async def hybrid_channel_verification(self, ws_session, guilds_data):
         """Гибридная верификация: HTTP + WebSocket каналов"""
         logger.info("🔍 Starting hybrid channel verification...")
-        
+
         http_working = []
         websocket_only = []
         total_monitoring = []
         failed_completely = []
-        
-        # Проверяем все каналы из конфига
-        for server, channels in config.SERVER_CHANNEL_MAPPINGS.items():
-            if not channels:
-                continue
-                
-            for channel_id, channel_name in channels.items():
-                logger.debug(f"🧪 Testing {server}#{channel_name}...")
-                
-                # Тест 1: HTTP API
+
+        # HTTP-пробы всех каналов гоняем параллельно: работа чисто
+        # латентная, семафор удерживает нагрузку в рамках rate limit
+        sem = asyncio.Semaphore(20)
+
+        async def _probe(server, channel_id, channel_name):
+            logger.debug("🧪 Testing {}#{}...", server, channel_name)
+            async with sem:
                 http_works = await self.test_http_access(
                     channel_id, server, channel_name, ws_session['token']
                 )
-                
-                # Тест 2: WebSocket
-                websocket_works = self.check_websocket_channel_access(channel_id, guilds_data)
-                
-                if http_works and websocket_works:
-                    self.http_accessible_channels.add(channel_id)
-                    self.websocket_accessible_channels.add(channel_id)
-                    self.subscribed_channels.add(channel_id)
-                    http_working.append((server, channel_name, channel_id))
-                    total_monitoring.append((server, channel_name, channel_id, "HTTP+WS"))
-                    
-                elif not http_works and websocket_works:
-                    self.websocket_accessible_channels.add(channel_id)
-                    self.subscribed_channels.add(channel_id)
-                    websocket_only.append((server, channel_name, channel_id))
-                    total_monitoring.append((server, channel_name, channel_id, "WS only"))
-                    
-                elif http_works and not websocket_works:
-                    self.http_accessible_channels.add(channel_id)
-                    logger.warning(f"   ⚠️ {server}#{channel_name} - HTTP only")
-                    
-                else:
-                    failed_completely.append((server, channel_name, channel_id))
+            return server, channel_id, channel_name, http_works
+
+        probes = await asyncio.gather(*[
+            _probe(server, channel_id, channel_name)
+            for server, channels in config.SERVER_CHANNEL_MAPPINGS.items()
+            for channel_id, channel_name in channels.items()
+        ], return_exceptions=True)
+
+        for probe in probes:
+            if isinstance(probe, BaseException):
+                continue
+            server, channel_id, channel_name, http_works = probe
+
+            # Тест 2: WebSocket (локальные данные guild-ов, без сети)
+            websocket_works = self.check_websocket_channel_access(channel_id, guilds_data)
+
+            if http_works and websocket_works:
+                self.http_accessible_channels.add(channel_id)
+                self.websocket_accessible_channels.add(channel_id)
+                self._subscribed_set.add(channel_id)
+                http_working.append((server, channel_name, channel_id))
+                total_monitoring.append((server, channel_name, channel_id, "HTTP+WS"))
+
+            elif not http_works and websocket_works:
+                self.websocket_accessible_channels.add(channel_id)
+                self._subscribed_set.add(channel_id)
+                websocket_only.append((server, channel_name, channel_id))
+                total_monitoring.append((server, channel_name, channel_id, "WS only"))
+
+            elif http_works and not websocket_works:
+                self.http_accessible_channels.add(channel_id)
+                logger.warning(f"   ⚠️ {server}#{channel_name} - HTTP only")
+
+            else:
+                failed_completely.append((server, channel_name, channel_id))
+
+        self._refresh_subscription_snapshot()
 
         # Выводим статистику
         logger.info(f"\n📊 Channel Verification Results:")
@@ -707,18 +964,18 @@ class DiscordWebSocketService:
         logger.info(f"   🔌 WebSocket only: {len(websocket_only)} channels")
         logger.info(f"   📡 Total monitoring: {len(total_monitoring)} channels")
         logger.info(f"   ❌ Failed: {len(failed_completely)} channels")
-        
+
         return len(total_monitoring)
 
     async def process_guild_channels(self, guild_data, ws_session):
         """Обработка каналов сервера"""
         try:
             guild_name = guild_data['name']
-            
+
             # Если это новый сервер, обрабатываем его
             if guild_name not in self.known_servers and self.auto_discovery_enabled:
                 await self._process_new_guild_real_time(guild_data, ws_session)
-                        
+
         except Exception as e:
             logger.error(f"Error processing guild channels: {e}")
 
@@ -726,75 +983,89 @@ class DiscordWebSocketService:
         """Обработка нового сообщения с проверкой подписок"""
         try:
             channel_id = message_data['channel_id']
-            
+
             # ВАЖНО: Проверяем подписку на канал
             if channel_id not in self.subscribed_channels:
-                logger.debug(f"🔇 Сообщение из неподписанного канала {channel_id} - игнорируем")
+                # Позиционный формат - строка собирается только при включенном DEBUG
+                logger.debug("🔇 Сообщение из неподписанного канала {} - игнорируем", channel_id)
                 return
-            
+
+            # Дубликат от параллельного токена - дальше не обрабатываем
+            message_id = message_data.get('id')
+            if message_id is not None:
+                if message_id in self._seen_ids:
+                    logger.debug("🔁 Дубликат сообщения {} от другого токена", message_id)
+                    return
+                self._seen_ids[message_id] = time.monotonic()
+                if len(self._seen_ids) > self._seen_max:
+                    self._seen_ids.popitem(last=False)
+
             # Логируем для отладки
-            logger.debug(f"📨 Сообщение из подписанного канала {channel_id}")
-            
-            # Находим информацию о канале
-            server_name = None
-            channel_name = None
-            
-            for server, channels in config.SERVER_CHANNEL_MAPPINGS.items():
-                if channel_id in channels:
-                    server_name = server
-                    channel_name = channels[channel_id]
-                    break
-            
-            if not server_name:
+            logger.debug("📨 Сообщение из подписанного канала {}", channel_id)
+
+            # Находим информацию о канале по индексу - O(1) на сообщение
+            mapped = self._channel_index.get(channel_id)
+            if mapped is None:
                 logger.warning(f"⚠️ Сообщение из подписанного но немапленного канала {channel_id}")
                 return
-            
+            server_name, channel_name = mapped
+
             # Безопасная обработка контента
             try:
                 content = message_data.get('content', '')
                 if content:
-                    content = content.encode('utf-8', 'surrogatepass').decode('utf-8', 'replace')
-                    content = ''.join(char for char in content if ord(char) < 0x110000)
+                    if not content.isascii():
+                        content = content.encode('utf-8', 'surrogatepass').decode('utf-8', 'replace')
+                        content = content.translate(_SURROGATE_TABLE)
                 else:
                     return
             except:
                 content = '[Message content encoding error]'
-            
+
             try:
                 author = message_data['author']['username']
-                author = author.encode('utf-8', 'surrogatepass').decode('utf-8', 'replace')
-                author = ''.join(char for char in author if ord(char) < 0x110000)
+                if not author.isascii():
+                    author = author.encode('utf-8', 'surrogatepass').decode('utf-8', 'replace')
+                    author = author.translate(_SURROGATE_TABLE)
             except:
                 author = 'Unknown User'
-            
+
             if not content.strip():
                 return
-            
-            # Создаем объект сообщения
+
+            # Создаем объект сообщения. Время берем из снежинки - битовый
+            # сдвиг вместо разбора 30-символьной ISO-строки на сообщение
+            try:
+                ts_ms = (int(message_id) >> 22) + _DISCORD_EPOCH_MS
+                msg_time = datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc)
+            except (TypeError, ValueError):
+                msg_time = datetime.fromisoformat(message_data['timestamp'].replace('Z', '+00:00'))
             message = Message(
                 content=content,
-                timestamp=datetime.fromisoformat(message_data['timestamp'].replace('Z', '+00:00')),
+                timestamp=msg_time,
                 server_name=server_name,
                 channel_name=channel_name,
-                author=author
+                author=author,
+                message_id=message_data.get('id'),
+                epoch=msg_time.timestamp()
             )
-            
+
             # Определяем тип доступа для логирования
             access_type = ""
             if channel_id in self.http_accessible_channels and channel_id in self.websocket_accessible_channels:
                 access_type = " (HTTP+WS)"
             elif channel_id in self.websocket_accessible_channels:
                 access_type = " (WS only)"
-            
+
             logger.info(f"🎉 NEW MESSAGE RECEIVED{access_type}!")
             logger.info(f"   📍 {server_name}#{channel_name}")
             logger.info(f"   👤 {author}")
             logger.info(f"   💬 {content[:100]}...")
-            
+
             # Пересылаем в Telegram
             if self.telegram_bot:
                 await self.forward_to_telegram(message)
-                
+
         except Exception as e:
             logger.error(f"❌ Error handling new message: {e}")
 
@@ -802,18 +1073,60 @@ class DiscordWebSocketService:
         """Пересылка сообщения в Telegram с правильным управлением топиками"""
         try:
             logger.info(f"🚀 Forwarding to Telegram: {message.server_name}#{message.channel_name}")
-            
+
+            # Если приложение подключило общую очередь - коалесцируем отправку
+            if self.outbound_queue is not None:
+                await self.outbound_queue.put(message)
+                return
+
             loop = asyncio.get_event_loop()
-            
+
             # Получаем существующий топик
             topic_id = await loop.run_in_executor(
                 None,
                 self.telegram_bot.get_server_topic_id,
                 message.server_name
             )
-            
+
             # Создаем новый топик только если нужно
             if topic_id is None:
                 if self.telegram_bot._check_if_supergroup_with_topics(config.TELEGRAM_CHAT_ID):
                     logger.info(f"🔍 No existing topic found for {message.server_name}, creating new one...")
-                    topic_i
\ No newline at end of file
+                    topic_id = await loop.run_in_executor(
+                        None,
+                        self.telegram_bot._get_or_create_topic_safe,
+                        message.server_name
+                    )
+
+                    if topic_id is None:
+                        logger.error(f"❌ Failed to get/create topic for {message.server_name}")
+                        return
+                else:
+                    logger.error("❌ Cannot create topic - chat doesn't support topics")
+                    return
+            else:
+                logger.info(f"✅ Using existing topic {topic_id} for {message.server_name}")
+
+            # Форматируем и отправляем сообщение
+            formatted = self.telegram_bot.format_message(message)
+            sent_msg = await loop.run_in_executor(
+                None,
+                self.telegram_bot._send_message,
+                formatted,
+                None,
+                topic_id,
+                message.server_name
+            )
+
+            if sent_msg:
+                self.telegram_bot.message_mappings[str(message.timestamp)] = sent_msg.message_id
+                # Запись на диск амортизируется фоновым сбросом
+                self._mapping_dirty = True
+
+                topic_info = f" to topic {topic_id}" if topic_id else " as regular message"
+                logger.success(f"✅ Successfully forwarded{topic_info}")
+            else:
+                logger.error("❌ Failed to send to Telegram")
+
+        except Exception as e:
+            logger.error(f"❌ Error forwarding to Telegram: {e}")
@@ -1,4 +1,5 @@
 import telebot
+from loguru import logger
 from typing import List, Dict
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 from datetime import datetime
@@ -44,21 +45,19 @@ class TelegramBotService:
     def sync_servers(self):
         """Sync Discord servers with Telegram topics"""
         try:
-            # Get current Discord servers
-            current_servers = set(config.SERVER_CHANNEL_MAPPINGS.keys())
-            
-            # Get Telegram topics
-            telegram_topics = set(self.server_topics.keys())
-            
+            # Живые dict.keys() views: разность считается напрямую,
+            # без копирования ключей в промежуточные set
+            current_servers = config.SERVER_CHANNEL_MAPPINGS.keys()
+            telegram_topics = self.server_topics.keys()
+
             logger.info(f"🔄 Syncing servers...")
             logger.info(f"   Discord servers: {len(current_servers)}")
             logger.info(f"   Telegram topics: {len(telegram_topics)}")
-            
-            # Clean up invalid topics first
+
+            # Clean up invalid topics first (view отражает изменения сам)
             cleaned_topics = self.cleanup_invalid_topics()
             if cleaned_topics > 0:
                 logger.info(f"   🧹 Cleaned {cleaned_topics} invalid topics")
-                telegram_topics = set(self.server_topics.keys())  # Refresh after cleanup
             
             # Find new servers (create topics)
             new_servers = current_servers - telegram_topics
@@ -71,13 +70,16 @@ class TelegramBotService:
             removed_servers = telegram_topics - current_servers
             if removed_servers:
                 logger.info(f"   🗑️ Removing topics for deleted servers: {len(removed_servers)}")
+                removed_any = False
                 for server in removed_servers:
                     if server in self.server_topics:
                         old_topic_id = self.server_topics[server]
                         del self.server_topics[server]
+                        removed_any = True
                         logger.info(f"      • Removed {server} (topic {old_topic_id})")
-                
-                if removed_servers:
+
+                # Single disk write after all removals
+                if removed_any:
                     self._save_data()
             
             logger.success(f"✅ Server sync completed")
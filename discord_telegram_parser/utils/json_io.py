@@ -0,0 +1,37 @@
+"""JSON сериализация: orjson (C-реализация) если установлен, иначе stdlib"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_indented(obj) -> str:
+    """Сериализация с отступами для конфигов/сайдкаров
+
+    orjson на порядок быстрее stdlib json, особенно с indent -
+    stdlib собирает отступы конкатенацией строк на уровне Python.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(obj, indent=2, ensure_ascii=False)
+
+
+def dumps(obj) -> str:
+    """Компактная сериализация горячих путей (payload-ы Gateway)"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def loads(data):
+    """Десериализация горячих путей (ответы Discord API)
+
+    orjson принимает bytes напрямую - без промежуточного декодирования
+    в str, которое делает requests' Response.json().
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
@@ -0,0 +1,41 @@
+import asyncio
+import time
+
+class AsyncTokenBucket:
+    """Асинхронный token bucket для глобального лимита Discord REST (50 req / 10 сек)
+
+    Все вызовы REST API проходят через acquire(): вместо 429 + retry
+    запросы просто ждут появления свободного токена.
+    """
+
+    def __init__(self, rate: float = 5.0, capacity: int = 50):
+        self.rate = rate  # Пополнение токенов в секунду
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int = 1):
+        """Блокируемся, пока не появится `tokens` свободных токенов"""
+        async with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                float(self.capacity),
+                self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+
+            if self.tokens < tokens:
+                # Ждем ровно столько, сколько нужно для недостающих токенов
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+                self.tokens = 0.0
+                self.updated = time.monotonic()
+            else:
+                self.tokens -= tokens
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False